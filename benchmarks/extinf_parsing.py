@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+"""Compare the #EXTINF parsing of common.py with a hand-written attribute scanner
+
+The fixture is a generated playlist with the irregularities found in real
+playlists: missing, empty or repeated attributes, commas in values and
+titles, odd durations, tabs and unbalanced quotes. Both parsers must give
+the same results on every line.
+
+Usage: benchmarks/extinf_parsing.py [entries] [repeats]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "usr", "lib", "hypnotix"))
+import common  # noqa: E402
+
+HOSTS = ["http://logo.example.com/picons/", "https://cdn.img.net/p/", "http://x.y/"]
+
+
+def generate_lines(count, seed=1):
+    """Return count #EXTINF lines"""
+    rand = random.Random(seed)
+    lines = []
+    for index in range(count):
+        choice = rand.random()
+        if choice < 0.5:
+            group = "TV %s" % rand.choice(["France", "Germany", "News", "Sports;HD", "Kids"])
+            name = "Channel %d" % index
+        elif choice < 0.8:
+            group = "VOD %s" % rand.choice(["Action", "Drama", "Comedy"])
+            name = "Movie %d (%d)" % (index, 1990 + index % 30)
+        else:
+            group = "SERIES %s" % rand.choice(["Drama", "Kids"])
+            name = "Show %d S%02d E%02d" % (index % 97, index % 5 + 1, index % 20 + 1)
+        logo = rand.choice(HOSTS) + "l%d.%s" % (index % 500, rand.choice(["png", "jpg", "JPEG", "gif", "svg"]))
+        attributes = ['tvg-id="id%d"' % index, 'tvg-name="%s"' % name, 'tvg-logo="%s"' % logo, 'group-title="%s"' % group]
+        if rand.random() < 0.05:
+            attributes = attributes[1:]
+        if rand.random() < 0.05:
+            attributes[-1] = 'group-title=""'
+        if rand.random() < 0.03:
+            attributes.append('x="a,b"')
+        if rand.random() < 0.02:
+            attributes.append('tvg-name="  "')
+        if rand.random() < 0.01:
+            attributes.append('weird="a="b"')
+        if rand.random() < 0.01:
+            attributes.append('k="v"z="w"')
+        if rand.random() < 0.01:
+            attributes.append('\tt="tab"')
+        if rand.random() < 0.01:
+            attributes.append('open="quote')
+        rand.shuffle(attributes)
+        duration = rand.choice(["-1", "0", "123", "-1 ", "", "-"])
+        title = name if rand.random() < 0.9 else " Other, title %d" % index
+        lines.append("#EXTINF:%s %s,%s" % (duration, " ".join(attributes), title))
+    return lines
+
+
+def regex_extinf(line):
+    """The parsing done by Channel.__init__ before parse_extinf()"""
+    match = common.EXTINF.fullmatch(line)
+    if match is None:
+        return None
+    return dict(common.PARAMS.findall(match.group("params"))), match.group("title")
+
+
+def scan_extinf(line, fallback=common.parse_extinf):
+    """Single pass equivalent of common.parse_extinf()
+
+    The attributes are found by splitting the params on quotes. Lines for
+    which that wouldn't give the same result as the regexes (whitespace other
+    than spaces, quotes which aren't around values...) go through them.
+    """
+    if not line.startswith("#EXTINF:"):
+        return None
+    if "\n" in line:
+        return fallback(line)
+    start = 8
+    if line.startswith("-", start):
+        start += 1
+    if not line[start:start + 1].isdecimal():
+        return None
+    # The regex takes a single digit of the duration, the others are part of the params
+    start += 1
+    if line.startswith(" ", start):
+        start += 1
+    comma = line.rfind(",", start)
+    if comma == -1:
+        return None
+    segments = line[start:comma].split('"')
+    params = {}
+    for index in range(0, len(segments) - 2, 2):
+        key = segments[index]
+        value = segments[index + 1]
+        if not key.endswith("=") or value.endswith("=") or (index > 0 and " " not in key):
+            # An attribute glued to the previous one makes the regex take both as a key
+            return fallback(line)
+        key = key[key.rfind(" ") + 1:-1]
+        if key == "" or not key.isprintable():
+            return fallback(line)
+        params[key] = value
+    return params, line[comma + 1:]
+
+
+def measure(function, lines, repeats):
+    """Return the best time taken by function over lines, in seconds"""
+    best = None
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        for line in lines:
+            function(line)
+        duration = time.perf_counter() - start
+        if best is None or duration < best:
+            best = duration
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    lines = generate_lines(count)
+    for line in lines:
+        expected = regex_extinf(line)
+        if common.parse_extinf(line) != expected or scan_extinf(line) != expected:
+            print("Mismatch: %r" % line)
+            sys.exit(1)
+    fallbacks = []
+    for line in lines:
+        scan_extinf(line, fallbacks.append)
+    fallbacks = len(fallbacks)
+    print("%d entries, %d (%.1f%%) need the regexes in the scanner" % (count, fallbacks, 100 * fallbacks / count))
+    for name, function in [("regexes (before)", regex_extinf), ("parse_extinf()", common.parse_extinf), \
+        ("scanner", scan_extinf)]:
+        print("%-18s %.2fs" % (name, measure(function, lines, repeats)))
+
+    names = [common.parse_channel_info(line)[0] for line in lines]
+    for name, function in [("SERIES regex", common.SERIES.fullmatch), \
+        ("SERIES prefilter", lambda name: common.SERIES.fullmatch(name) if common.is_episode_name(name) else None)]:
+        print("%-18s %.2fs" % (name, measure(function, names, repeats)))
+
+
+if __name__ == "__main__":
+    main()
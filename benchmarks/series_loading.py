@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+"""Time the loading of a playlist made of the episodes of many series
+
+All the episodes are in a single group, which is the worst case for the
+membership test of Group.series. The playlist is loaded with the
+IndexedList lists of common.py, then with plain lists as before, and both
+must give the same catalog. The cache of hypnotix is redirected to a
+temporary directory, so the one of the user isn't touched.
+
+Usage: benchmarks/series_loading.py [series] [episodes per series] [repeats]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Must be set before GLib reads it, when common is imported
+CACHE_PATH = tempfile.mkdtemp(prefix="hypnotix-benchmark-")
+os.environ["XDG_CACHE_HOME"] = CACHE_PATH
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "usr", "lib", "hypnotix"))
+import common  # noqa: E402
+
+
+class Settings:
+    """The settings read by Manager, with their default values"""
+
+    def get_int(self, key):
+        return 256
+
+    def get_string(self, key):
+        return ""
+
+
+def write_playlist(path, series, episodes):
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("#EXTM3U\n")
+        for episode in range(episodes):
+            for serie in range(series):
+                name = "Show %d S%02d E%02d" % (serie, episode // 10 + 1, episode % 10 + 1)
+                file.write('#EXTINF:-1 tvg-name="%s" tvg-logo="http://logos.example.com/%d.png" group-title="SERIES All",%s\n' \
+                    % (name, serie, name))
+                file.write("http://streams.example.com/series/%d/%d.mkv\n" % (serie, episode))
+
+
+def load(manager, path):
+    """Load the playlist, return the time it took and a summary of the catalog"""
+    provider = common.Provider("Benchmark", None)
+    provider.path = path
+    start = time.perf_counter()
+    manager.load_channels(provider)
+    duration = time.perf_counter() - start
+    catalog = [(group.name, [serie.name for serie in group.series], [channel.url for channel in group.channels]) \
+        for group in provider.groups]
+    catalog.append([(serie.name, [channel.url for channel in serie.episodes]) for serie in provider.series])
+    return duration, catalog
+
+
+def main():
+    series = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    episodes = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    try:
+        run(series, episodes, repeats)
+    finally:
+        shutil.rmtree(CACHE_PATH)
+
+
+def run(series, episodes, repeats):
+    if not common.PROVIDERS_PATH.startswith(CACHE_PATH):
+        print("The cache of hypnotix couldn't be redirected to %s" % CACHE_PATH)
+        sys.exit(1)
+    # A new cache has no old logos to remove
+    os.makedirs(common.PROVIDERS_PATH)
+    open(common.LEGACY_LOGOS_MARKER, "w").close()
+    manager = common.Manager(Settings())
+    path = os.path.join(CACHE_PATH, "series.m3u")
+    write_playlist(path, series, episodes)
+    print("%d series of %d episodes in one group" % (series, episodes))
+    results = {}
+    for name, list_class in [("IndexedList", common.IndexedList), ("list (before)", list)]:
+        indexed_list = common.IndexedList
+        common.IndexedList = list_class
+        try:
+            runs = [load(manager, path) for repeat in range(repeats)]
+        finally:
+            common.IndexedList = indexed_list
+        results[name] = runs[0][1]
+        print("%-14s %.2fs" % (name, min(duration for duration, catalog in runs)))
+    if results["IndexedList"] != results["list (before)"]:
+        print("The catalogs are different")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,27 @@
 #!/usr/bin/python3
+import gzip
+import hashlib
+import heapq
+import io
+import json
+import mmap
+import multiprocessing
 import os
+import pickle
 import re
+import shutil
+import struct
+import sys
 import threading
+import time
+import weakref
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import accumulate, islice
+from urllib.parse import urlsplit
 
 import requests
 from gi.repository import GLib, GObject
@@ -9,13 +29,60 @@ from gi.repository import GLib, GObject
 # M3U parsing regex
 PARAMS = re.compile(r'(\S+)="(.*?)"')
 EXTINF = re.compile(r'^#EXTINF:(?P<duration>-?\d+?) ?(?P<params>.*),(?P<title>.*?)$')
+LINE_END = re.compile(rb"[\r\n]")
+
+# HTTP Content-Range header of a partial response
+CONTENT_RANGE = re.compile(r"bytes (?P<start>\d+)-(?P<end>\d+)/(?P<total>\d+|\*)")
 SERIES = re.compile(r"(?P<series>.*?) S(?P<season>.\d{1,2}).*E(?P<episode>.\d{1,2}.*)$", re.IGNORECASE)
+# #EXTINF attributes which are parsed into Channel fields, the other ones are kept as they are
+CHANNEL_PARAMS = {"tvg-name", "tvg-logo", "group-title"}
 
 PROVIDERS_PATH = os.path.join(GLib.get_user_cache_dir(), "hypnotix", "providers")
 
 TV_GROUP, MOVIES_GROUP, SERIES_GROUP = range(3)
 
 FAVORITES_PATH = os.path.join(GLib.get_user_cache_dir(), "hypnotix", "favorites", "list")
+# Changes made to the favorites since the list was last written
+FAVORITES_JOURNAL_PATH = FAVORITES_PATH + ".journal"
+# The journal is compacted into the list when it has more records than this
+FAVORITES_JOURNAL_MAX_RECORDS = 256
+
+# Downloaded playlists are kept gzip-compressed, unless they're big enough to be memory-mapped
+PLAYLIST_COMPRESSION_LEVEL = 6
+PLAYLIST_BLOCK_SIZE = 1024 * 1024
+
+# Number of channels parsed before the loader hands a batch over to the UI
+LOAD_BATCH_SIZE = 5000
+# Playlists bigger than this are loaded into a ChannelStore instead of Channel objects
+CHANNEL_STORE_MIN_SIZE = 32 * 1024 * 1024
+# Playlists bigger than this are parsed in parallel, in parts of PARALLEL_LOAD_PART_SIZE
+PARALLEL_LOAD_MIN_SIZE = 64 * 1024 * 1024
+PARALLEL_LOAD_PART_SIZE = 8 * 1024 * 1024
+
+# Downloaded logos, named after a hash of their URL
+LOGOS_PATH = os.path.join(GLib.get_user_cache_dir(), "hypnotix", "logos")
+# Created once the logos which older versions stored next to the playlists are removed
+LEGACY_LOGOS_MARKER = os.path.join(PROVIDERS_PATH, ".legacy-logos-removed")
+# Default size limit of the logo cache, see the logo-cache-size setting
+LOGO_CACHE_MAX_SIZE = 256 * 1024 * 1024
+# Number of logos downloaded at the same time, in total and from a single host
+LOGO_DOWNLOAD_WORKERS = 16
+LOGO_DOWNLOADS_PER_HOST = 6
+# Logos which failed to download are retried after LOGO_RETRY_DELAY seconds, doubled
+# after each failure up to LOGO_RETRY_MAX_DELAY. Failures are forgotten when a logo
+# wasn't requested for LOGO_RETRY_MAX_DELAY after its retry time.
+LOGO_RETRY_DELAY = 10 * 60
+LOGO_RETRY_MAX_DELAY = 7 * 24 * 60 * 60
+# Logos and posters, decoded and scaled to the sizes they are shown at
+THUMBNAILS_PATH = os.path.join(GLib.get_user_cache_dir(), "hypnotix", "thumbnails")
+# When the pack file would get bigger than this, it is rewritten with the most
+# recently used thumbnails, up to half of it
+THUMBNAIL_PACK_MAX_SIZE = 512 * 1024 * 1024
+
+# Snapshots of the parsed playlists, used to skip parsing when they didn't change
+CATALOGS_PATH = os.path.join(GLib.get_user_cache_dir(), "hypnotix", "catalogs")
+# Bump this whenever the parser or the Provider/Group/Serie/Channel classes change
+CATALOG_VERSION = 9
 
 # Used as a decorator to run things in the background
 def async_function(func):
@@ -36,12 +103,89 @@ def idle_function(func):
     return wrapper
 
 
+def parse_extinf(line):
+    """Parse an #EXTINF line
+
+    Args:
+        line (str): The #EXTINF line
+
+    Returns:
+        tuple: (params, title), or None if this isn't a valid #EXTINF line
+    """
+    match = EXTINF.fullmatch(line)
+    if match is None:
+        return None
+    # Scan the params in place rather than on a copy of them
+    return dict(PARAMS.findall(line, match.start("params"), match.end("params"))), match.group("title")
+
+
+def parse_channel_info(info):
+    """Parse the attributes of a channel from its #EXTINF line
+
+    Args:
+        info (str): The #EXTINF line
+
+    Returns:
+        tuple: (name, title, logo, group_title, params), the params dict holds every
+            attribute, the other values can be None
+    """
+    name = None
+    title = None
+    logo = None
+    group_title = None
+    params = {}
+    parsed = parse_extinf(info)
+    if parsed is not None:
+        params, title = parsed
+        value = params.get("tvg-name", "").strip()
+        if value != "":
+            name = value
+        value = params.get("tvg-logo", "").strip()
+        if value != "":
+            logo = value
+        value = params.get("group-title", "").strip()
+        if value != "":
+            group_title = value.replace(";", " ").replace("  ", " ")
+    if name is None and "," in info:
+        name = info.rpartition(",")[2].strip()
+    if title == name:
+        title = name
+    return name, title, logo, group_title, params
+
+
+def is_episode_name(name):
+    """Quick check for the " S" that SERIES.fullmatch() needs (the long s matches too)"""
+    return " S" in name or " s" in name or " \u017f" in name
+
+
+class SlugTable(dict):
+    """Translation table for slugify(), filled in as new characters are met"""
+
+    def __missing__(self, code):
+        char = chr(code)
+        # Lowercase characters one by one, str.lower() would handle final sigmas differently
+        self[code] = char.lower() if char.isalnum() else None
+        return self[code]
+
+
+SLUG_TABLE = SlugTable()
+
+
+def get_resident_memory():
+    """Return the resident memory of this process, in bytes"""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return 0
+
+
 def slugify(string):
     """
     Normalizes string, converts to lowercase, removes non-alpha characters,
     and converts spaces to hyphens.
     """
-    return "".join(x.lower() for x in string if x.isalnum())
+    return string.translate(SLUG_TABLE)
 
 
 class Provider:
@@ -51,6 +195,8 @@ class Provider:
         else:
             self.name = name
         self.path = os.path.join(PROVIDERS_PATH, slugify(self.name))
+        # False when a refresh found that the playlist didn't change
+        self.modified = True
         self.groups = []
         self.channels = []
         self.movies = []
@@ -60,6 +206,76 @@ class Provider:
         return "%s:::%s:::%s:::%s:::%s:::%s" % (self.name, self.type_id, self.url, self.username, self.password, self.epg)
 
 
+class IndexedList(list):
+    """A list with a constant-time membership test
+
+    Items are indexed by identity, so `item in items` doesn't scan the list.
+    """
+
+    def __init__(self, items=()):
+        super().__init__(items)
+        self.index_items()
+
+    def __reduce__(self):
+        # The index holds object ids, rebuild it when unpickled
+        return (IndexedList, (list(self),))
+
+    def index_items(self):
+        self.counts = {}
+        for item in self:
+            self.counts[id(item)] = self.counts.get(id(item), 0) + 1
+
+    def add_item(self, item):
+        self.counts[id(item)] = self.counts.get(id(item), 0) + 1
+
+    def remove_item(self, item):
+        count = self.counts[id(item)] - 1
+        if count == 0:
+            del self.counts[id(item)]
+        else:
+            self.counts[id(item)] = count
+
+    def __contains__(self, item):
+        return id(item) in self.counts
+
+    def append(self, item):
+        super().append(item)
+        self.add_item(item)
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def insert(self, index, item):
+        super().insert(index, item)
+        self.add_item(item)
+
+    def remove(self, item):
+        super().remove(item)
+        self.remove_item(item)
+
+    def pop(self, index=-1):
+        item = super().pop(index)
+        self.remove_item(item)
+        return item
+
+    def clear(self):
+        super().clear()
+        self.counts = {}
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self.index_items()
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self.index_items()
+
+
 class Group:
     def __init__(self, name):
         if "VOD" in name.split():
@@ -69,15 +285,14 @@ class Group:
         else:
             self.group_type = TV_GROUP
         self.name = name
-        self.channels = []
-        self.series = []
+        self.channels = IndexedList()
+        self.series = IndexedList()
 
 
 class Serie:
     def __init__(self, name):
         self.name = name
         self.logo = None
-        self.logo_path = None
         self.seasons = {}
         self.episodes = []
 
@@ -88,54 +303,1423 @@ class Season:
         self.episodes = {}
 
 
+def get_logo_path(logo):
+    """Return the local path of a logo URL
+
+    Logos are stored under a hash of their URL, so a logo which is used by
+    several channels or providers is only downloaded and stored once.
+    """
+    if logo is None:
+        return None
+    if logo.startswith("file://"):
+        return logo[7:]
+    ext = ""
+    lower_logo = logo.lower()
+    for known_ext in [".png", ".jpg", ".gif", ".jpeg"]:
+        if lower_logo.endswith(known_ext):
+            ext = known_ext
+            break
+    if ext == ".jpeg":
+        ext = ".jpg"
+    key = hashlib.sha1(logo.encode("utf-8", errors="ignore")).hexdigest()
+    return os.path.join(LOGOS_PATH, key + ext)
+
+
+class LogoCache:
+    """Index of the downloaded logos
+
+    Each logo is recorded with its size, the time it was last used and the
+    sources (providers, favorites) which refer to it. When the logos take more
+    than max_size bytes, the least recently used ones are removed. A logo is
+    also removed when no source refers to it anymore.
+
+    Failed downloads are recorded too, so that dead logo URLs are only retried
+    with an exponential backoff.
+    """
+
+    def __init__(self, path=LOGOS_PATH, max_size=LOGO_CACHE_MAX_SIZE):
+        self.path = path
+        self.index_path = os.path.join(path, "index.json")
+        self.failures_path = os.path.join(path, "failures.json")
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        # name -> [size, last used, sources]
+        self.entries = {}
+        # name -> [number of failures, time of the next attempt, reason]
+        self.failures = {}
+        self.size = 0
+        self.modified = False
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+            self.size = sum(entry[0] for entry in self.entries.values())
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print("Could not load the logo cache index: %s" % e)
+        try:
+            with open(self.failures_path, "r", encoding="utf-8") as f:
+                now = time.time()
+                self.failures = {name: failure for name, failure in json.load(f).items() \
+                    if failure[1] + LOGO_RETRY_MAX_DELAY > now}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print("Could not load the logo failures: %s" % e)
+
+    def save(self):
+        with self.lock:
+            if not self.modified:
+                return
+            try:
+                for path, data in [(self.index_path, self.entries), (self.failures_path, self.failures)]:
+                    with open(path + ".tmp", "w", encoding="utf-8") as f:
+                        json.dump(data, f)
+                    os.replace(path + ".tmp", path)
+                self.modified = False
+            except Exception as e:
+                print("Could not save the logo cache index: %s" % e)
+
+    def is_failing(self, path) -> bool:
+        """Check if the download of a logo failed recently, and shouldn't be attempted yet"""
+        failure = self.failures.get(os.path.basename(path))
+        return failure is not None and failure[1] > time.time()
+
+    def add_failure(self, path, reason):
+        """Record a failed download of a logo
+
+        Args:
+            path (str): The path of the logo, see get_logo_path()
+            reason (str): What went wrong, an HTTP status, "dns" or "timeout" for instance
+        """
+        name = os.path.basename(path)
+        with self.lock:
+            failure = self.failures.get(name)
+            count = 1 if failure is None else failure[0] + 1
+            delay = min(LOGO_RETRY_DELAY * 2 ** (count - 1), LOGO_RETRY_MAX_DELAY)
+            self.failures[name] = [count, time.time() + delay, reason]
+            self.modified = True
+
+    def lookup(self, path, source) -> bool:
+        """Check if a logo is cached, and mark it as used by source
+
+        Args:
+            path (str): The path of the logo, see get_logo_path()
+            source (str): The name of the provider which uses the logo
+
+        Returns:
+            bool: True if the logo is cached
+        """
+        name = os.path.basename(path)
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                self.misses += 1
+                return False
+            self.hits += 1
+            self.bytes_saved += entry[0]
+            entry[1] = time.time()
+            if source not in entry[2]:
+                entry[2].append(source)
+            self.modified = True
+            return True
+
+    def add(self, path, source, file):
+        """Store a downloaded logo
+
+        Args:
+            path (str): The path of the logo, see get_logo_path()
+            source (str): The name of the provider which uses the logo
+            file (file object): The content of the logo
+        """
+        name = os.path.basename(path)
+        with open(path + ".tmp", "wb") as f:
+            shutil.copyfileobj(file, f)
+            size = f.tell()
+        os.replace(path + ".tmp", path)
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None:
+                self.size -= entry[0]
+            self.entries[name] = [size, time.time(), [source]]
+            self.size += size
+            self.failures.pop(name, None)
+            self.modified = True
+            if self.size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        """Remove the least recently used logos, down to 90% of the maximum size"""
+        for name, entry in sorted(self.entries.items(), key=lambda item: item[1][1]):
+            if self.size <= self.max_size * 0.9:
+                break
+            self.remove(name)
+
+    def remove(self, name):
+        entry = self.entries.pop(name)
+        self.size -= entry[0]
+        try:
+            os.remove(os.path.join(self.path, name))
+        except FileNotFoundError:
+            pass
+
+    def release(self, source):
+        """Forget that source uses logos, and remove the logos nothing else uses"""
+        with self.lock:
+            for name, entry in list(self.entries.items()):
+                if source in entry[2]:
+                    entry[2].remove(source)
+                    if len(entry[2]) == 0:
+                        self.remove(name)
+            self.modified = True
+        self.save()
+
+    def get_stats(self):
+        requests_count = self.hits + self.misses
+        hit_rate = 100 * self.hits / requests_count if requests_count > 0 else 0
+        return "%d logos, %.1f MB, %.0f%% hit rate, %.1f MB saved, %d failing" % (len(self.entries), \
+            self.size / 1048576, hit_rate, self.bytes_saved / 1048576, len(self.failures))
+
+
+class LogoDownloader:
+    """Download logos into a LogoCache with a pool of threads
+
+    Each thread keeps its own HTTP session, so connections to a host are
+    reused. Downloads are queued per host, by priority (lowest first), and at
+    most per_host of them run at the same time for a given host. A logo which
+    is already queued or being downloaded isn't requested again, its callback
+    is called when the first download completes or fails.
+    """
+
+    def __init__(self, logo_cache, workers=LOGO_DOWNLOAD_WORKERS, per_host=LOGO_DOWNLOADS_PER_HOST):
+        self.logo_cache = logo_cache
+        self.per_host = per_host
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="logos")
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        # path -> callbacks of a download which is queued or in progress
+        self.callbacks = {}
+        # path -> queued download, as a [priority, order, host, url, path, source, headers] list
+        self.jobs = {}
+        # host -> heap of queued downloads
+        self.queues = {}
+        # host -> number of downloads in progress
+        self.active = {}
+        self.pending = 0
+        self.order = 0
+
+    def get_session(self):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = requests.Session()
+            self.local.session = session
+        return session
+
+    def download(self, url, path, source, headers, callback=None, priority=0):
+        """Queue the download of a logo
+
+        Args:
+            url (str): The URL of the logo
+            path (str): Where to store it, see get_logo_path()
+            source (str): The name of the provider which uses the logo
+            headers (dict): HTTP headers of the request
+            callback (function, optional): Called with True once the logo is stored,
+                or with False if the download failed
+            priority (int, optional): Downloads with a lower priority are done first. Defaults to 0.
+        """
+        with self.lock:
+            callbacks = self.callbacks.get(path)
+            if callbacks is None:
+                self.callbacks[path] = []
+                host = urlsplit(url).netloc
+                job = [priority, self.order, host, url, path, source, headers]
+                self.order += 1
+                self.jobs[path] = job
+                heapq.heappush(self.queues.setdefault(host, []), job)
+                self.pending += 1
+                self.schedule(host)
+            if callback is not None:
+                self.callbacks[path].append(callback)
+
+    def reprioritize(self, priorities):
+        """Change the priority of queued downloads
+
+        Args:
+            priorities (dict): New priority of the downloads, by path. Downloads
+                whose priority is None are dropped, with their callbacks.
+
+        Returns:
+            set: The paths of the downloads which were dropped
+        """
+        dropped = set()
+        with self.lock:
+            hosts = set()
+            for path, priority in priorities.items():
+                job = self.jobs.get(path)
+                if job is None or job[0] == priority:
+                    # Not queued (in progress or done), or unchanged
+                    continue
+                hosts.add(job[2])
+                if priority is None:
+                    del self.jobs[path]
+                    del self.callbacks[path]
+                    self.pending -= 1
+                    dropped.add(path)
+                else:
+                    job[0] = priority
+            for host in hosts:
+                queue = [job for job in self.queues[host] if job[4] in self.jobs]
+                if len(queue) > 0:
+                    heapq.heapify(queue)
+                    self.queues[host] = queue
+                else:
+                    del self.queues[host]
+        return dropped
+
+    def schedule(self, host):
+        # Must be called with the lock held
+        queue = self.queues.get(host)
+        if queue is None:
+            return
+        while len(queue) > 0 and self.active.get(host, 0) < self.per_host:
+            job = heapq.heappop(queue)
+            del self.jobs[job[4]]
+            self.active[host] = self.active.get(host, 0) + 1
+            self.executor.submit(self.run, *job[2:])
+        if len(queue) == 0:
+            del self.queues[host]
+
+    def run(self, host, url, path, source, headers):
+        stored = False
+        try:
+            with self.get_session().get(url, headers=headers, timeout=10, stream=True) as response:
+                if response.status_code == 200:
+                    response.raw.decode_content = True
+                    self.logo_cache.add(path, source, response.raw)
+                    stored = True
+                else:
+                    self.logo_cache.add_failure(path, "HTTP %d" % response.status_code)
+        except requests.exceptions.Timeout:
+            self.logo_cache.add_failure(path, "timeout")
+        except requests.exceptions.ConnectionError as e:
+            # Name resolution errors are wrapped in connection errors
+            self.logo_cache.add_failure(path, "dns" if "resolve" in str(e).lower() or "name or service" in str(e).lower() \
+                else "connection")
+        except Exception as e:
+            print(e)
+            self.logo_cache.add_failure(path, type(e).__name__)
+        with self.lock:
+            callbacks = self.callbacks.pop(path)
+            self.active[host] -= 1
+            self.pending -= 1
+            finished = self.pending == 0
+            self.schedule(host)
+        for callback in callbacks:
+            callback(stored)
+        if finished:
+            self.logo_cache.save()
+            print("Logo cache: %s" % self.logo_cache.get_stats())
+
+
+class ThumbnailPack:
+    """Decoded and scaled images, stored in a single memory-mapped file
+
+    Thumbnails are kept as raw pixel data, appended to the pack file. Each
+    thumbnail adds a record to an index file, which is read on load: offset,
+    length, width, height, rowstride, alpha, modification time of the
+    original image and key. Keys start with the name of the image in
+    source_path, followed by a colon.
+
+    When the pack would get bigger than max_size, it is compacted: the
+    thumbnails of images which were removed or changed are dropped, and so
+    are the least recently used ones until the pack is half of max_size.
+    """
+
+    RECORD = struct.Struct("<QIIIIBqH")
+
+    def __init__(self, path=THUMBNAILS_PATH, max_size=THUMBNAIL_PACK_MAX_SIZE, source_path=LOGOS_PATH):
+        self.pack_path = path + ".pack"
+        self.index_path = path + ".index"
+        self.max_size = max_size
+        self.source_path = source_path
+        # key -> (offset, length, width, height, rowstride, has_alpha, mtime), least recently used first
+        self.entries = OrderedDict()
+        self.map = None
+        self.pack_file = None
+        self.index_file = None
+        self.size = 0
+        self.load()
+
+    def load(self):
+        try:
+            self.size = os.path.getsize(self.pack_path)
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.clear()
+            return
+        position = 0
+        while position + self.RECORD.size <= len(data):
+            offset, length, width, height, rowstride, has_alpha, mtime, key_length = \
+                self.RECORD.unpack_from(data, position)
+            position += self.RECORD.size
+            key = data[position:position + key_length].decode("utf-8", errors="ignore")
+            position += key_length
+            if position <= len(data) and offset + length <= self.size:
+                # Later records are more recent
+                self.entries.pop(key, None)
+                self.entries[key] = (offset, length, width, height, rowstride, bool(has_alpha), mtime)
+
+    def clear(self):
+        self.close()
+        for path in [self.pack_path, self.index_path]:
+            open(path, "wb").close()
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def close(self):
+        for f in [self.map, self.pack_file, self.index_file]:
+            if f is not None:
+                f.close()
+        self.map = self.pack_file = self.index_file = None
+
+    def get(self, key, mtime):
+        """Return a thumbnail
+
+        Args:
+            key (str): The image and the size it is shown at
+            mtime (int): The modification time of the image, in ns
+
+        Returns:
+            tuple: (pixels, width, height, rowstride, has_alpha), or None if there's
+                no thumbnail for this version of the image
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry[6] != mtime:
+            return None
+        self.entries.move_to_end(key)
+        offset, length, width, height, rowstride, has_alpha, _ = entry
+        if self.map is None or len(self.map) < offset + length:
+            if self.map is not None:
+                self.map.close()
+            with open(self.pack_path, "rb") as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map[offset:offset + length], width, height, rowstride, has_alpha
+
+    def add(self, key, mtime, pixels, width, height, rowstride, has_alpha):
+        """Store a thumbnail, see get()"""
+        if len(pixels) > self.max_size // 2:
+            return
+        if self.size + len(pixels) > self.max_size:
+            self.compact()
+        if self.pack_file is None:
+            self.pack_file = open(self.pack_path, "ab")
+            self.index_file = open(self.index_path, "ab")
+        offset = self.size
+        self.pack_file.write(pixels)
+        self.pack_file.flush()
+        self.size += len(pixels)
+        encoded_key = key.encode("utf-8", errors="ignore")
+        self.index_file.write(self.RECORD.pack(offset, len(pixels), width, height, rowstride, has_alpha, mtime, \
+            len(encoded_key)) + encoded_key)
+        self.index_file.flush()
+        self.entries.pop(key, None)
+        self.entries[key] = (offset, len(pixels), width, height, rowstride, has_alpha, mtime)
+
+    def is_current(self, key, mtime):
+        """Return whether the image of a thumbnail is still there and unchanged"""
+        try:
+            return os.stat(os.path.join(self.source_path, key.rsplit(":", 3)[0])).st_mtime_ns == mtime
+        except OSError:
+            return False
+
+    def compact(self):
+        """Rewrite the pack with the most recently used thumbnails of current images"""
+        kept = []
+        size = 0
+        for key, entry in reversed(self.entries.items()):
+            if size + entry[1] > self.max_size // 2:
+                break
+            if self.is_current(key, entry[6]):
+                kept.append((key, entry))
+                size += entry[1]
+        self.close()
+        entries = OrderedDict()
+        try:
+            with open(self.pack_path, "rb") as source, open(self.pack_path + ".tmp", "wb") as pack_file, \
+                    open(self.index_path + ".tmp", "wb") as index_file:
+                pack = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) if len(kept) > 0 else None
+                offset = 0
+                for key, (old_offset, length, width, height, rowstride, has_alpha, mtime) in reversed(kept):
+                    pack_file.write(pack[old_offset:old_offset + length])
+                    encoded_key = key.encode("utf-8", errors="ignore")
+                    index_file.write(self.RECORD.pack(offset, length, width, height, rowstride, has_alpha, mtime, \
+                        len(encoded_key)) + encoded_key)
+                    entries[key] = (offset, length, width, height, rowstride, has_alpha, mtime)
+                    offset += length
+                if pack is not None:
+                    pack.close()
+            # The old index mustn't be used with the new pack, empty it first
+            open(self.index_path, "wb").close()
+            os.replace(self.pack_path + ".tmp", self.pack_path)
+            os.replace(self.index_path + ".tmp", self.index_path)
+        except (OSError, ValueError) as e:
+            print("Could not compact the thumbnails: %s" % e)
+            self.clear()
+            return
+        self.entries = entries
+        self.size = offset
+
+
+def split_prefix(string):
+    """Split a URL after its last slash and intern the prefix, which is usually shared with other URLs"""
+    if string is None:
+        return None, None
+    index = string.rfind("/") + 1
+    return sys.intern(string[:index]), string[index:]
+
+
 class Channel:
-    def __init__(self, provider, info):
-        self.info = info
+    # Large playlists contain hundreds of thousands of channels, keep them compact
+    __slots__ = ("_info", "_extra", "id", "name", "title", "group_title", "_logo_prefix", "_logo_file", "_url_prefix", "_url_file", \
+        "__weakref__")
+
+    def __init__(self, info, keep_info=False):
+        # The raw line is only kept when asked for, see the info property
+        self._info = info if keep_info else None
         self.id = None
-        self.name = None
-        self.logo = None
-        self.logo_path = None
-        self.group_title = None
-        self.title = None
         self.url = None
-        match = EXTINF.fullmatch(info)
-        if match is not None:
-            res = match.groupdict()
-            if 'params' in res:
-                params = dict(PARAMS.findall(res['params']))
-                if "tvg-name" in params and params['tvg-name'].strip() != "":
-                    self.name = params['tvg-name'].strip()
-                if "tvg-logo" in params and params['tvg-logo'].strip() != "":
-                    self.logo = params['tvg-logo'].strip()
-                if "group-title" in params and params['group-title'].strip() != "":
-                    self.group_title = params['group-title'].strip().replace(";", " ").replace("  ", " ")
-            if 'title' in res:
-                self.title = res['title']
-        if self.name is None and "," in info:
-            self.name = info.split(",")[-1].strip()
-        if self.logo is not None:
-            if self.logo.startswith("file://"):
-                self.logo_path = self.logo[7:]
+        self.name, self.title, self.logo, group_title, params = parse_channel_info(info)
+        self.group_title = None if group_title is None else sys.intern(group_title)
+        # Attributes which aren't parsed (tvg-id, catchup...) are needed to rebuild the line
+        extra = ['%s="%s"' % item for item in params.items() if item[0] not in CHANNEL_PARAMS]
+        self._extra = " ".join(extra) if len(extra) > 0 and self._info is None else None
+
+    def __getstate__(self):
+        return (self._info, self._extra, self.id, self.name, self.title, self.group_title, \
+            self._logo_prefix, self._logo_file, self._url_prefix, self._url_file)
+
+    def __setstate__(self, state):
+        (self._info, self._extra, self.id, self.name, self.title, self.group_title, \
+            self._logo_prefix, self._logo_file, self._url_prefix, self._url_file) = state
+        # Share the strings which are common to many channels again
+        if self.group_title is not None:
+            self.group_title = sys.intern(self.group_title)
+        if self._logo_prefix is not None:
+            self._logo_prefix = sys.intern(self._logo_prefix)
+        if self._url_prefix is not None:
+            self._url_prefix = sys.intern(self._url_prefix)
+
+    @property
+    def info(self):
+        if self._info is not None:
+            return self._info
+        # Rebuild an equivalent #EXTINF line from the parsed attributes, only the duration is lost
+        params = ['tvg-logo="%s"' % (self.logo or ""), 'group-title="%s"' % (self.group_title or "")]
+        if '"' not in self.name:
+            # Names with quotes can't come from a tvg-name, they're parsed from the title again
+            params.insert(0, 'tvg-name="%s"' % self.name)
+        if self._extra is not None:
+            params.append(self._extra)
+        return "#EXTINF:-1 %s,%s" % (" ".join(params), self.title if self.title is not None else self.name)
+
+    @property
+    def logo(self):
+        if self._logo_file is None:
+            return None
+        return self._logo_prefix + self._logo_file
+
+    @logo.setter
+    def logo(self, logo):
+        self._logo_prefix, self._logo_file = split_prefix(logo)
+
+    @property
+    def url(self):
+        if self._url_file is None:
+            return None
+        return self._url_prefix + self._url_file
+
+    @url.setter
+    def url(self, url):
+        self._url_prefix, self._url_file = split_prefix(url)
+
+
+class PackedStrings:
+    """A column of strings, packed into a single string"""
+
+    def __init__(self):
+        self.text = ""
+        self.chunks = []
+        self.pending = []
+        # Each string is followed by a newline, ends[i] is the position of the newline after string i
+        self.ends = array("L")
+
+    def __len__(self):
+        return len(self.ends) + len(self.pending)
+
+    def __getitem__(self, index):
+        if len(self.pending) > 0 or len(self.chunks) > 0:
+            self.pack()
+        start = self.ends[index - 1] + 1 if index > 0 else 0
+        return self.text[start:self.ends[index]]
+
+    def __getstate__(self):
+        self.pack()
+        return self.text, self.ends
+
+    def __setstate__(self, state):
+        self.text, self.ends = state
+        self.chunks = []
+        self.pending = []
+
+    def append(self, string):
+        self.pending.append(string)
+        if len(self.pending) >= 4096:
+            self.flush()
+
+    def flush(self):
+        if len(self.pending) > 0:
+            start = self.ends[-1] + 1 if len(self.ends) > 0 else 0
+            # Positions of the newlines which follow the pending strings
+            starts = accumulate(map((1).__add__, map(len, self.pending)), initial=start)
+            self.ends.extend(map((-1).__add__, islice(starts, 1, None)))
+            self.pending.append("")
+            self.chunks.append("\n".join(self.pending))
+            self.pending = []
+
+    def pack(self):
+        self.flush()
+        if len(self.chunks) > 0:
+            self.chunks.insert(0, self.text)
+            self.text = "".join(self.chunks)
+            self.chunks = []
+
+    def search(self, text):
+        """Return the indexes of the strings which contain text (lower-cased), in order"""
+        self.pack()
+        haystack = self.text.lower()
+        if text == "" or len(haystack) != len(self.text):
+            # Lower-casing changed the offsets, compare the strings one by one
+            return [index for index in range(len(self.ends)) if text in self[index].lower()]
+        indexes = []
+        position = haystack.find(text)
+        while position != -1:
+            index = bisect_right(self.ends, position)
+            indexes.append(index)
+            # Skip to the next string
+            position = haystack.find(text, self.ends[index] + 1)
+        return indexes
+
+
+class ChannelStore:
+    """Column-oriented storage for the channels of a very large provider
+
+    Names, titles, logos and URLs are kept in packed string tables, logo and URL
+    prefixes in a shared table and groups as ids in typed arrays. Channel objects
+    are only created when a row is accessed and are shared as long as they're used.
+
+    The store is filled by the loader thread while the UI reads it, the columns and
+    the rows of its ChannelRows lists are only accessed with the lock held.
+    """
+
+    TITLE_IS_NONE, TITLE_IS_NAME, LOGO_IS_NONE = 1, 2, 4
+    # Attributes which aren't saved in catalog snapshots
+    CACHES = ["lock", "channels", "group_index", "prefix_index"]
+
+    def __init__(self):
+        self.group_names = []
+        self.group_ids = array("l")
+        self.names = PackedStrings()
+        # Group titles of the rare channels which have one but no group
+        self.group_titles = {}
+        self.init_columns()
+        self.init_caches()
+
+    def init_columns(self):
+        self.flags = array("B")
+        self.titles = PackedStrings()
+        self.logo_prefixes = array("L")
+        self.logo_files = PackedStrings()
+        self.url_prefixes = array("L")
+        self.url_files = PackedStrings()
+        self.extras = PackedStrings()
+        self.prefixes = []
+
+    def init_caches(self):
+        self.lock = threading.Lock()
+        self.channels = weakref.WeakValueDictionary()
+        self.group_index = {name: index for index, name in enumerate(self.group_names)}
+        self.prefix_index = {prefix: index for index, prefix in enumerate(self.prefixes)}
+
+    def __len__(self):
+        return len(self.group_ids)
+
+    def __getstate__(self):
+        with self.lock:
+            state = self.__dict__.copy()
+            for value in state.values():
+                if isinstance(value, PackedStrings):
+                    # Pack them now, so they aren't modified while they're pickled
+                    value.pack()
+        for name in self.CACHES:
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.init_caches()
+
+    def get_prefix_id(self, prefix):
+        index = self.prefix_index.get(prefix)
+        if index is None:
+            index = len(self.prefixes)
+            self.prefixes.append(prefix)
+            self.prefix_index[prefix] = index
+        return index
+
+    def add(self, channel, group):
+        """Add a channel to the store
+
+        Args:
+            channel (Channel): The parsed channel
+            group (Group): The group of the channel, or None
+
+        Returns:
+            int: The row of the channel
+        """
+        with self.lock:
+            row = len(self.group_ids)
+            if group is None:
+                self.group_ids.append(-1)
+                if channel.group_title is not None:
+                    self.group_titles[row] = channel.group_title
             else:
-                ext = None
-                for known_ext in [".png", ".jpg", ".gif", ".jpeg"]:
-                    if self.logo.lower().endswith(known_ext):
-                        ext = known_ext
+                group_id = self.group_index.get(group.name)
+                if group_id is None:
+                    group_id = len(self.group_names)
+                    self.group_names.append(group.name)
+                    self.group_index[group.name] = group_id
+                self.group_ids.append(group_id)
+            self.names.append(channel.name)
+            self.add_columns(channel)
+            return row
+
+    def add_columns(self, channel):
+        flags = 0
+        if channel.title is None:
+            flags |= self.TITLE_IS_NONE
+            self.titles.append("")
+        elif channel.title == channel.name:
+            flags |= self.TITLE_IS_NAME
+            self.titles.append("")
+        else:
+            self.titles.append(channel.title)
+        if channel._logo_file is None:
+            flags |= self.LOGO_IS_NONE
+            self.logo_prefixes.append(0)
+            self.logo_files.append("")
+        else:
+            self.logo_prefixes.append(self.get_prefix_id(channel._logo_prefix))
+            self.logo_files.append(channel._logo_file)
+        self.url_prefixes.append(self.get_prefix_id(channel._url_prefix))
+        self.url_files.append(channel._url_file)
+        self.extras.append(channel._extra or "")
+        self.flags.append(flags)
+
+    def get_channel(self, row):
+        """Return the Channel of a row, creating it if needed"""
+        channel = self.channels.get(row)
+        if channel is not None:
+            return channel
+        with self.lock:
+            channel = self.create_channel(row)
+            self.channels[row] = channel
+        return channel
+
+    def create_channel(self, row):
+        flags = self.flags[row]
+        channel = Channel.__new__(Channel)
+        channel._info = None
+        channel._extra = self.extras[row] or None
+        channel.id = None
+        channel.name = self.names[row]
+        if flags & self.TITLE_IS_NONE:
+            channel.title = None
+        elif flags & self.TITLE_IS_NAME:
+            channel.title = channel.name
+        else:
+            channel.title = self.titles[row]
+        group_id = self.group_ids[row]
+        if group_id == -1:
+            channel.group_title = self.group_titles.get(row)
+        else:
+            channel.group_title = self.group_names[group_id]
+        if flags & self.LOGO_IS_NONE:
+            channel._logo_prefix = channel._logo_file = None
+        else:
+            channel._logo_prefix = self.prefixes[self.logo_prefixes[row]]
+            channel._logo_file = self.logo_files[row]
+        channel._url_prefix = self.prefixes[self.url_prefixes[row]]
+        channel._url_file = self.url_files[row]
+        return channel
+
+
+class PlaylistEntry:
+    """An entry of a playlist, as found by read_playlist_entries()"""
+    __slots__ = ("name", "group_title", "offset", "url_offset")
+
+    def __init__(self, name, group_title, offset):
+        self.name = name
+        self.group_title = group_title
+        self.offset = offset
+        self.url_offset = None
+
+    def __getstate__(self):
+        return (self.name, self.group_title, self.offset, self.url_offset)
+
+    def __setstate__(self, state):
+        self.name, self.group_title, self.offset, self.url_offset = state
+
+
+class PlaylistIndex(ChannelStore):
+    """Index of the entries of a playlist file
+
+    Only the names, groups and the offsets of the #EXTINF and URL lines are kept.
+    The playlist is memory-mapped and the lines of an entry are only parsed when
+    its Channel is accessed. It is mapped as soon as the index is created or
+    loaded, so that the index keeps reading the file it was built from when a
+    refresh replaces it with a new one. The file must not be modified in place.
+    """
+
+    CACHES = ChannelStore.CACHES + ["map"]
+
+    def __init__(self, path):
+        self.path = path
+        super().__init__()
+
+    def init_columns(self):
+        self.offsets = array("Q")
+        self.url_offsets = array("Q")
+        self.prefixes = []
+
+    def init_caches(self):
+        super().init_caches()
+        # The mapping keeps the file alive after it's replaced
+        with open(self.path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def add_columns(self, entry):
+        self.offsets.append(entry.offset)
+        self.url_offsets.append(entry.url_offset)
+
+    def read_line(self, offset):
+        end = LINE_END.search(self.map, offset)
+        end = len(self.map) if end is None else end.start()
+        return self.map[offset:end].decode("utf-8", errors="ignore").strip()
+
+    def create_channel(self, row):
+        # The line is at hand, keep it rather than its extra attributes
+        channel = Channel(self.read_line(self.offsets[row]), keep_info=True)
+        channel.url = self.read_line(self.url_offsets[row])
+        return channel
+
+
+class ChannelRows:
+    """A list of channels stored in a ChannelStore
+
+    It behaves like a list of Channel objects, which are only created when
+    they are accessed.
+    """
+
+    def __init__(self, store, rows=None):
+        self.store = store
+        self.rows = array("L") if rows is None else rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        with self.store.lock:
+            rows = self.rows[index]
+        if isinstance(index, slice):
+            return ChannelRows(self.store, rows)
+        return self.store.get_channel(rows)
+
+    def __iter__(self):
+        # Rows may still be added by the loader, iterate over the current ones
+        with self.store.lock:
+            rows = self.rows[:]
+        get_channel = self.store.get_channel
+        for row in rows:
+            yield get_channel(row)
+
+    def append(self, row):
+        with self.store.lock:
+            self.rows.append(row)
+
+    def search(self, text):
+        """Return the channels whose lower-cased name contains text"""
+        with self.store.lock:
+            rows = self.rows[:]
+            found = self.store.names.search(text)
+        matches = array("L")
+        for row in found:
+            # Rows are in ascending order
+            index = bisect_right(rows, row) - 1
+            if index >= 0 and rows[index] == row:
+                matches.append(row)
+        return ChannelRows(self.store, matches)
+
+
+def search_channels(channels, text):
+    """Return the channels whose lower-cased name contains text"""
+    if isinstance(channels, ChannelRows):
+        return channels.search(text)
+    return [channel for channel in channels if text in channel.name.lower()]
+
+
+class Favorites:
+    """The favorite channels, as "info:::url" lines keyed by a hash of their URL
+
+    The list file holds a compacted copy of the favorites. Additions and
+    removals are appended to a journal, which is replayed on load and
+    compacted into the list once it gets long. The Channel objects of the
+    favorites are parsed once and kept up to date as favorites change.
+    """
+
+    def __init__(self, path=FAVORITES_PATH, journal_path=FAVORITES_JOURNAL_PATH):
+        self.path = path
+        self.journal_path = journal_path
+        self.entries = {}
+        self.records = 0
+        self.channels = {}
+        self.channel_list = None
+
+    @staticmethod
+    def get_id(url):
+        return hashlib.sha1(url.encode("utf-8", errors="ignore")).hexdigest()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(list(self.entries.values()))
+
+    def __contains__(self, data):
+        return self.entries.get(self.get_id(data.rpartition(":::")[2])) == data
+
+    def get(self, url):
+        """Return the favorite with this URL, or None"""
+        return self.entries.get(self.get_id(url))
+
+    def get_channels(self):
+        """Return the favorites as Channel objects, in the order they were added"""
+        if self.channel_list is None:
+            for entry_id, data in self.entries.items():
+                if entry_id not in self.channels:
+                    info, _, url = data.rpartition(":::")
+                    channel = Channel(info, keep_info=True)
+                    channel.url = url
+                    self.channels[entry_id] = channel
+            self.channel_list = [self.channels[entry_id] for entry_id in self.entries]
+        return self.channel_list
+
+    def load(self):
+        self.entries = {}
+        self.records = 0
+        self.channels = {}
+        self.channel_list = None
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8", errors="ignore") as f:
+                for line in f:
+                    line = line.strip()
+                    if line != "":
+                        self.entries[self.get_id(line.rpartition(":::")[2])] = line
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8", errors="ignore") as f:
+                for line in f:
+                    op, _, value = line.strip().partition(" ")
+                    if op == "+":
+                        entry_id = self.get_id(value.rpartition(":::")[2])
+                        self.entries.pop(entry_id, None)
+                        self.entries[entry_id] = value
+                    elif op == "-":
+                        self.entries.pop(value, None)
+                    else:
+                        # Truncated record, from an interrupted write
+                        continue
+                    self.records += 1
+        if self.records > FAVORITES_JOURNAL_MAX_RECORDS:
+            self.compact()
+
+    def add(self, data):
+        """Add a favorite, replacing the one with the same URL if any"""
+        entry_id = self.get_id(data.rpartition(":::")[2])
+        if self.entries.get(entry_id) == data:
+            return
+        self.entries.pop(entry_id, None)
+        self.entries[entry_id] = data
+        self.channels.pop(entry_id, None)
+        self.channel_list = None
+        self.write_record("+", data)
+
+    def remove(self, data):
+        entry_id = self.get_id(data.rpartition(":::")[2])
+        if self.entries.pop(entry_id, None) is not None:
+            channel = self.channels.pop(entry_id, None)
+            if self.channel_list is not None and channel is not None:
+                self.channel_list.remove(channel)
+            self.write_record("-", entry_id)
+
+    def write_record(self, op, value):
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write("%s %s\n" % (op, value))
+        self.records += 1
+        if self.records > FAVORITES_JOURNAL_MAX_RECORDS:
+            self.compact()
+
+    def compact(self):
+        """Write the favorites to the list and empty the journal"""
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            for data in self.entries.values():
+                f.write(f"{data}\n")
+        os.replace(self.path + ".tmp", self.path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.records = 0
+
+
+class DeflateDecompressor:
+    """Decompress "deflate" HTTP content, which is either zlib or raw deflate data"""
+
+    def __init__(self):
+        self.decompressor = None
+
+    def decompress(self, data):
+        if self.decompressor is None:
+            if len(data) == 0:
+                return b""
+            # zlib data starts with a 0x?8 byte, some servers send raw deflate data
+            wbits = zlib.MAX_WBITS if data[0] & 0x0f == 8 else -zlib.MAX_WBITS
+            self.decompressor = zlib.decompressobj(wbits)
+        return self.decompressor.decompress(data)
+
+
+def is_compressed(path):
+    """Return True if a playlist file is gzip-compressed"""
+    with open(path, "rb") as file:
+        return file.read(2) == b"\x1f\x8b"
+
+
+def get_playlist_size(path):
+    """Return the uncompressed size of a playlist file, in bytes"""
+    if not is_compressed(path):
+        return os.path.getsize(path)
+    with open(path, "rb") as file:
+        # The uncompressed size (modulo 4 GiB) is at the end of the gzip trailer
+        file.seek(-4, os.SEEK_END)
+        return int.from_bytes(file.read(4), "little")
+
+
+def open_playlist(path):
+    """Open a playlist for reading as text, decompressing it on the fly if needed"""
+    if is_compressed(path):
+        return gzip.open(path, "rt", encoding="utf-8", errors="ignore")
+    return open(path, "r", encoding="utf-8", errors="ignore")
+
+
+def convert_playlist(path, compress):
+    """Compress or decompress a playlist file, in place"""
+    if compress:
+        with open(path, "rb") as source, gzip.open(path + ".tmp", "wb", compresslevel=PLAYLIST_COMPRESSION_LEVEL) as file:
+            shutil.copyfileobj(source, file, PLAYLIST_BLOCK_SIZE)
+    else:
+        with gzip.open(path, "rb") as source, open(path + ".tmp", "wb") as file:
+            shutil.copyfileobj(source, file, PLAYLIST_BLOCK_SIZE)
+    os.replace(path + ".tmp", path)
+
+
+def get_partial_path(provider):
+    """Return the path of the partial download of the playlist of a provider"""
+    return provider.path + ".part"
+
+
+class PlaylistDownload(io.RawIOBase):
+    """The body of a playlist response, saved to disk while it is read
+
+    Reading it returns the uncompressed playlist, so it can be parsed while it
+    is being downloaded. The bytes are written as they are received to a
+    partial file, which is kept when the transfer fails so that the next
+    attempt can resume it with a Range request (see Manager.request_playlist()).
+    finish() checks the size of the whole transfer and atomically replaces the
+    cached playlist with it.
+    """
+
+    def __init__(self, provider, response):
+        self.provider = provider
+        self.response = response
+        self.path = get_partial_path(provider)
+        self.encoding = response.headers.get("content-encoding", "identity").strip().lower()
+        if self.encoding in ["gzip", "x-gzip"]:
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self.encoding == "deflate":
+            self.decompressor = DeflateDecompressor()
+        elif self.encoding == "identity":
+            self.decompressor = None
+        else:
+            response.close()
+            raise ValueError("unsupported content encoding %s" % self.encoding)
+        # Bytes received by previous attempts
+        self.resumed_size = 0
+        self.total_size = None
+        if response.status_code == 206:
+            self.resumed_size = os.path.getsize(self.path)
+            content_range = response.headers.get("content-range", "")
+            match = CONTENT_RANGE.fullmatch(content_range.strip())
+            with open(self.path + ".json", "r") as file:
+                encoding = json.load(file)["content-encoding"]
+            if match is None or int(match.group("start")) != self.resumed_size or encoding != self.encoding:
+                response.close()
+                os.remove(self.path)
+                raise IOError("unexpected range %s (%s)" % (content_range, self.encoding))
+            if match.group("total") != "*":
+                self.total_size = int(match.group("total"))
+            self.file = open(self.path, "ab")
+            print("%s: resuming the download after %d bytes" % (provider.name, self.resumed_size))
+        else:
+            if response.headers.get("content-length") is not None:
+                self.total_size = int(response.headers.get("content-length"))
+            self.file = open(self.path, "wb")
+        self.validators = {
+            "url": provider.url,
+            "etag": response.headers.get("etag"),
+            "last-modified": response.headers.get("last-modified"),
+            "content-length": None if self.total_size is None else str(self.total_size),
+            "content-encoding": self.encoding,
+        }
+        with open(self.path + ".json", "w") as file:
+            json.dump(self.validators, file)
+        self.chunks = self.get_chunks()
+        self.pending = b""
+        self.head = b""
+        self.start_time = time.monotonic()
+        # Uncompressed size of the playlist, if it can be guessed
+        self.expected_size = 0
+        if self.encoding == "identity" and self.total_size is not None:
+            self.expected_size = self.total_size
+        elif os.path.exists(provider.path):
+            # Assume it didn't change much since the previous download
+            self.expected_size = get_playlist_size(provider.path)
+
+    def get_chunks(self):
+        if self.resumed_size > 0:
+            # Replay what was received by the previous attempts
+            with open(self.path, "rb") as file:
+                left = self.resumed_size
+                while left > 0:
+                    data = file.read(min(left, PLAYLIST_BLOCK_SIZE))
+                    if len(data) == 0:
                         break
-                if ext == ".jpeg":
-                    ext = ".jpg"
-                if provider is None:
-                    # favorite channel, no provider
-                    provider_name = "favorites"
-                else:
-                    provider_name = provider.name
-                self.logo_path = os.path.join(PROVIDERS_PATH, "%s-%s%s" % (slugify(provider_name), slugify(self.name), ext))
+                    left -= len(data)
+                    yield data
+        for data in self.response.raw.stream(PLAYLIST_BLOCK_SIZE, decode_content=False):
+            self.file.write(data)
+            yield data
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while len(self.pending) == 0:
+            data = next(self.chunks, None)
+            if data is None:
+                self.check_header(b"", end=True)
+                return 0
+            if self.decompressor is not None:
+                data = self.decompress(data)
+            self.check_header(data)
+            self.pending = data
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def decompress(self, data):
+        result = self.decompressor.decompress(data)
+        # Gzip streams can be made of several members
+        while self.encoding != "deflate" and self.decompressor.eof and len(self.decompressor.unused_data) > 0:
+            data = self.decompressor.unused_data
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            result += self.decompressor.decompress(data)
+        return result
+
+    def check_header(self, data, end=False):
+        """Make sure the playlist starts with an #EXTM3U header, as soon as possible"""
+        if self.head is None:
+            return
+        self.head += data
+        if b"#EXTM3U" in self.head:
+            self.head = None
+        elif len(self.head) >= 4096 or end:
+            raise ValueError("not a M3U playlist")
+
+    def get_received_size(self):
+        """Return the number of bytes received by this attempt, before decompression"""
+        return self.response.raw.tell()
+
+    def finish(self):
+        """Check the download and make it the cached playlist of the provider"""
+        self.file.close()
+        received = self.get_received_size()
+        size = os.path.getsize(self.path)
+        if self.total_size is not None and size != self.total_size:
+            if size < self.total_size:
+                raise IOError("the download is incomplete (%d bytes instead of %d)" % (size, self.total_size))
+            raise ValueError("the file size is incorrect (%d bytes instead of %d)" % (size, self.total_size))
+        duration = max(time.monotonic() - self.start_time, 0.001)
+        print("%s: downloaded %d bytes in %.1fs (%.2f MB/s)" % (self.provider.name, received, duration, received / duration / 1048576))
+        if self.encoding == "deflate":
+            # Decompress it, its size is only known once it is decompressed
+            decompressor = DeflateDecompressor()
+            with open(self.path, "rb") as source, open(self.path + ".tmp", "wb") as file:
+                for data in iter(lambda: source.read(PLAYLIST_BLOCK_SIZE), b""):
+                    file.write(decompressor.decompress(data))
+            os.replace(self.path + ".tmp", self.path)
+        # Big playlists are memory-mapped and parsed in parts, they need to be stored uncompressed,
+        # the other ones are kept gzip-compressed
+        small = get_playlist_size(self.path) < CHANNEL_STORE_MIN_SIZE
+        if is_compressed(self.path) and not small:
+            convert_playlist(self.path, compress=False)
+        elif not is_compressed(self.path) and small:
+            convert_playlist(self.path, compress=True)
+        os.replace(self.path, self.provider.path)
+        os.remove(self.path + ".json")
+
+    def abort(self, resumable=True):
+        """Stop the download
+
+        Args:
+            resumable (bool, optional): Keep what was received, so the next attempt can
+                resume it. Defaults to True.
+        """
+        self.response.close()
+        self.file.close()
+        if not resumable or (self.validators["etag"] is None and self.validators["last-modified"] is None):
+            # Without a validator, there is no way to make sure the next attempt gets the same playlist
+            for path in [self.path, self.path + ".json"]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def get_lines(self):
+        """Return the playlist as text lines, read like a local playlist"""
+        return io.TextIOWrapper(io.BufferedReader(self, PLAYLIST_BLOCK_SIZE), encoding="utf-8", errors="ignore")
+
+
+def read_playlist_lines(lines, debug):
+    """Parse the lines of a playlist
+
+    Args:
+        lines (iterable): The lines of the playlist
+        debug (function): Called with debugging information
+
+    Yields:
+        tuple: (channel, episode) for each channel which has a URL, episode is
+            a (series, season, episode) tuple of names or None
+    """
+    channel = None
+    for line in lines:
+        line = line.strip()
+        if line.startswith("#EXTM3U"):
+            continue
+        if line.startswith("#EXTINF"):
+            channel = Channel(line)
+            debug("New channel: ", line)
+            continue
+        if "://" in line and not (line.startswith("#")):
+            debug("    ", line)
+            if channel is None:
+                debug("    --> channel is None")
+                continue
+            if channel.url is not None:
+                # We already found the URL, skip the line
+                debug("    --> channel URL was already found")
+                continue
+            if channel.name is None or "***" in channel.name:
+                debug("    --> channel name is None")
+                continue
+            channel.url = line
+            debug("    --> URL found: ", line)
+
+            episode = None
+            f = SERIES.fullmatch(channel.name) if is_episode_name(channel.name) else None
+            if f is not None:
+                episode = f.group("series", "season", "episode")
+            yield channel, episode
+
+
+def read_playlist_entries(path, start, end, debug):
+    """Index the entries of a part of a playlist
+
+    This follows the same rules as read_playlist_lines(), but only the names,
+    group titles and offsets of the entries are kept.
+
+    Args:
+        path (str): The path of the playlist
+        start (int): Offset of the first byte of the part
+        end (int): Offset after the last byte of the part
+        debug (function): Called with debugging information
+
+    Yields:
+        tuple: (entry, episode) for each entry which has a URL, see read_playlist_lines()
+    """
+    entry = None
+    offset = start
+    with open(path, "rb") as file:
+        file.seek(start)
+        while offset < end:
+            data = file.readline(end - offset)
+            if len(data) == 0:
+                break
+            # Lone carriage returns end lines too, like when the playlist is read as text
+            for part in data.split(b"\r"):
+                line_offset = offset
+                offset += len(part) + 1
+                line = part.decode("utf-8", errors="ignore").strip()
+                if line.startswith("#EXTM3U"):
+                    continue
+                if line.startswith("#EXTINF"):
+                    name, title, logo, group_title, params = parse_channel_info(line)
+                    entry = PlaylistEntry(name, group_title, line_offset)
+                    debug("New channel: ", line)
+                    continue
+                if "://" in line and not (line.startswith("#")):
+                    debug("    ", line)
+                    if entry is None:
+                        debug("    --> channel is None")
+                        continue
+                    if entry.url_offset is not None:
+                        # We already found the URL, skip the line
+                        debug("    --> channel URL was already found")
+                        continue
+                    if entry.name is None or "***" in entry.name:
+                        debug("    --> channel name is None")
+                        continue
+                    entry.url_offset = line_offset
+                    debug("    --> URL found: ", line)
+
+                    episode = None
+                    f = SERIES.fullmatch(entry.name) if is_episode_name(entry.name) else None
+                    if f is not None:
+                        episode = f.group("series", "season", "episode")
+                    yield entry, episode
+            # The split added one byte too many for the last part
+            offset -= 1
+
+
+def read_playlist_range(path, start, end, indexed=False):
+    """Parse a part of a playlist, in a worker process
+
+    The part must start with an #EXTINF line (or be the start of the file),
+    so it can be parsed on its own.
+
+    Args:
+        path (str): The path of the playlist
+        start (int): Offset of the first byte of the part
+        end (int): Offset after the last byte of the part
+        indexed (bool, optional): Index the entries instead of parsing them,
+            see read_playlist_entries(). Defaults to False.
+
+    Returns:
+        list: The (channel, episode) or (entry, episode) tuples of the part
+    """
+    if indexed:
+        return list(read_playlist_entries(path, start, end, lambda *args: None))
+    with open(path, "rb") as file:
+        file.seek(start)
+        data = file.read(end - start)
+    # Same decoding and newline handling as when the whole file is read as text
+    lines = io.StringIO(data.decode("utf-8", errors="ignore"), newline=None)
+    del data
+    return list(read_playlist_lines(lines, lambda *args: None))
+
+
+def get_playlist_ranges(path, count):
+    """Split a playlist in byte ranges which start with an #EXTINF line
+
+    Args:
+        path (str): The path of the playlist
+        count (int): The number of ranges to aim for
+
+    Returns:
+        list: (start, end) tuples covering the whole file, in order
+    """
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, "rb") as file:
+        for index in range(1, count):
+            position = max(size * index // count, boundaries[-1])
+            file.seek(position)
+            found = -1
+            # Look for the next #EXTINF line, one block at a time
+            while found == -1:
+                block = file.read(1024 * 1024)
+                if len(block) == 0:
+                    break
+                found = block.find(b"\n#EXTINF")
+                if found == -1:
+                    # The separator may straddle two blocks
+                    position += max(len(block) - 7, 1)
+                    file.seek(position)
+            if found == -1:
+                break
+            boundaries.append(position + found + 1)
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
 
 class Manager:
     def __init__(self, settings):
         os.system("mkdir -p '%s'" % PROVIDERS_PATH)
+        os.system("mkdir -p '%s'" % CATALOGS_PATH)
+        os.system("mkdir -p '%s'" % LOGOS_PATH)
         self.verbose = False
         self.settings = settings
+        self.logo_cache = LogoCache(max_size=settings.get_int("logo-cache-size") * 1024 * 1024)
+        self.logo_downloader = LogoDownloader(self.logo_cache)
+        # Bytes which didn't need to be downloaded thanks to conditional requests
+        self.bytes_saved = 0
+        # Processes which parse big playlists, shared by the providers loaded at the same time
+        self.process_pool = None
+        self.process_pool_users = 0
+        self.process_pool_lock = threading.Lock()
+        if not os.path.exists(LEGACY_LOGOS_MARKER):
+            self.remove_legacy_logos()
+
+    @async_function
+    def remove_legacy_logos(self):
+        """Remove the logos which older versions stored next to the playlists
+
+        They were named "<provider>-<channel><extension>", with "None" as the extension
+        when it was unknown, and "<provider>-<file name>" for Xtream providers.
+        """
+        removed = 0
+        try:
+            for name in os.listdir(PROVIDERS_PATH):
+                if "-" in name and (name.endswith("None") or \
+                    name.lower().endswith((".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp"))):
+                    os.remove(os.path.join(PROVIDERS_PATH, name))
+                    removed += 1
+            open(LEGACY_LOGOS_MARKER, "w").close()
+        except Exception as e:
+            print("Could not remove the old logos: %s" % e)
+        if removed > 0:
+            print("Removed %d old logos" % removed)
 
     def debug(self, *args):
         if self.verbose:
@@ -151,7 +1735,39 @@ class Manager:
         Returns:
             bool: True for SUCCESS, False for ERROR
         """
+        ret_code, response = self.request_playlist(provider, refresh=refresh)
+        if response is not None:
+            try:
+                download = PlaylistDownload(provider, response)
+            except Exception as e:
+                print("%s: %s" % (provider.name, e))
+                return False
+            try:
+                while len(download.read(PLAYLIST_BLOCK_SIZE)) > 0:
+                    pass
+                download.finish()
+                self.save_validators(provider, download)
+            except Exception as e:
+                print("%s: %s" % (provider.name, e))
+                download.abort(resumable=not isinstance(e, ValueError))
+                ret_code = False
+        return ret_code
+
+    def request_playlist(self, provider, refresh=False):
+        """Request the playlist of a provider, if it needs to be downloaded
+
+        The body of the response isn't read, see PlaylistDownload.
+
+        Args:
+            provider (Provider): The provider
+            refresh (bool, optional): Download the playlist even if it is cached. Defaults to False.
+
+        Returns:
+            tuple: (bool, response), True for SUCCESS, False for ERROR and the
+                response to download, or None if the cached playlist can be used
+        """
         ret_code = True
+        response = None
 
         if "file://" in provider.url:
             # local file
@@ -165,54 +1781,131 @@ class Manager:
 
                 headers = {
                     'User-Agent': self.settings.get_string("user-agent"),
-                    'Referer': self.settings.get_string("http-referer")
+                    'Referer': self.settings.get_string("http-referer"),
+                    'Accept-Encoding': 'gzip, deflate'
                 }
+                validators = None
+                partial = self.load_partial_validators(provider)
+                if partial is not None:
+                    # Resume the previous download, if the playlist didn't change since
+                    headers['Range'] = "bytes=%d-" % os.path.getsize(get_partial_path(provider))
+                    headers['If-Range'] = partial["etag"] if partial.get("etag") is not None else partial["last-modified"]
+                elif os.path.exists(provider.path):
+                    # Only download the playlist if it changed since we got it
+                    validators = self.load_validators(provider)
+                    if validators.get("etag") is not None:
+                        headers['If-None-Match'] = validators["etag"]
+                    if validators.get("last-modified") is not None:
+                        headers['If-Modified-Since'] = validators["last-modified"]
                 try:
-                    response = requests.get(provider.url, headers=headers, timeout=(5, 120), stream=True)
+                    answer = requests.get(provider.url, headers=headers, timeout=(5, 120), stream=True)
+                    if partial is not None and answer.status_code == 416:
+                        # The partial download can't be resumed, start over
+                        answer.close()
+                        self.remove_partial_download(provider)
+                        return self.request_playlist(provider, refresh=refresh)
+
+                    if validators is not None and self.is_not_modified(answer, validators):
+                        answer.close()
+                        provider.modified = False
+                        size = os.path.getsize(provider.path)
+                        self.bytes_saved += size
+                        print("%s: playlist not modified, %d bytes saved (%d in total)" % (provider.name, size, self.bytes_saved))
+                        ret_code = True
 
                     # If there is an answer from the remote server
-                    if response.status_code == 200:
-                        # Set downloaded size
-                        downloaded_bytes = 0
-                        # Get total playlist byte size
-                        total_content_size = int(response.headers.get('content-length', 15))
-                        # Set stream blocks
-                        block_bytes = int(4 * 1024 * 1024)  # 4 MB
-
-                        response.encoding = response.encoding or response.apparent_encoding or "utf-8"
-                        with open(provider.path, "w", encoding=response.encoding) as file:
-                            # Grab data by block_bytes
-                            for data in response.iter_content(block_bytes, decode_unicode=True):
-                                downloaded_bytes += block_bytes
-                                print("{} bytes".format(downloaded_bytes))
-                                # if data is still bytes, decode it
-                                if isinstance(data, bytes):
-                                    data = data.decode('utf-8', errors='ignore')
-                                else:
-                                    data = str(data)
-                                # Write data to file
-                                file.write(data)
-                        if downloaded_bytes < total_content_size:
-                            print("The file size is incorrect, deleting")
-                            os.remove(provider.path)
-                        else:
-                            # Set the datatime when it was last retreived
-                            # self.settings.set_
-                            ret_code = True
+                    elif answer.status_code == 200 or (partial is not None and answer.status_code == 206):
+                        response = answer
+                        ret_code = True
                     else:
-                        print("HTTP error %d while retrieving from %s!" % (response.status_code, provider.url))
+                        answer.close()
+                        print("HTTP error %d while retrieving from %s!" % (answer.status_code, provider.url))
                 except Exception as e:
                     print(e)
         else:
             # No protocol, assume it's local
             provider.path = provider.url
 
-        return ret_code
+        return ret_code, response
+
+    def load_partial_validators(self, provider):
+        """Return the validators of the partial download of a playlist, or None if it can't be resumed"""
+        path = get_partial_path(provider)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return None
+        try:
+            with open(path + ".json", "r") as file:
+                validators = json.load(file)
+            if validators["etag"] is not None and validators["etag"].startswith("W/"):
+                # Weak ETags can't be used in If-Range
+                validators["etag"] = None
+            if validators["url"] == provider.url and (validators["etag"] is not None or validators["last-modified"] is not None):
+                return validators
+        except Exception:
+            pass
+        self.remove_partial_download(provider)
+        return None
+
+    def remove_partial_download(self, provider):
+        for path in [get_partial_path(provider), get_partial_path(provider) + ".json"]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def get_validators_path(self, provider):
+        return provider.path + ".json"
+
+    def load_validators(self, provider):
+        """Load the HTTP validators of the last download of a playlist
+
+        Args:
+            provider (Provider): The provider
+
+        Returns:
+            dict: The ETag, Last-Modified and Content-Length headers (lower-case keys), can be empty
+        """
+        try:
+            with open(self.get_validators_path(provider), "r") as file:
+                return json.load(file)
+        except Exception:
+            return {}
+
+    def save_validators(self, provider, download):
+        validators = {}
+        for header in ["etag", "last-modified", "content-length"]:
+            validators[header] = download.validators[header]
+        try:
+            with open(self.get_validators_path(provider), "w") as file:
+                json.dump(validators, file)
+        except Exception as e:
+            print("Could not save the validators of %s: %s" % (provider.name, e))
+
+    def is_not_modified(self, response, validators) -> bool:
+        """Check whether a response is for the playlist we already have
+
+        Args:
+            response (requests.Response): The response to a conditional request
+            validators (dict): The validators of the last download
+
+        Returns:
+            bool: True if the playlist doesn't need to be downloaded again
+        """
+        if response.status_code == 304:
+            return True
+        if response.status_code != 200:
+            return False
+        # Some servers ignore conditional requests, compare the validators ourselves
+        etag = response.headers.get("etag")
+        if etag is not None:
+            return etag == validators.get("etag") and not etag.startswith("W/")
+        last_modified = response.headers.get("last-modified")
+        length = response.headers.get("content-length")
+        return last_modified is not None and length is not None and \
+            last_modified == validators.get("last-modified") and length == validators.get("content-length")
 
     def check_playlist(self, provider):
         legit = False
         if os.path.exists(provider.path):
-            with open(provider.path, "r", encoding="utf-8", errors="ignore") as file:
+            with open_playlist(provider.path) as file:
                 content = file.read()
                 if "#EXTM3U" in content and "#EXTINF" in content:
                     legit = True
@@ -221,86 +1914,374 @@ class Manager:
                     self.debug("Nope: %s" % provider.path)
         return legit
 
-    def load_channels(self, provider):
-        with open(provider.path, "r", encoding="utf-8", errors="ignore") as file:
-            channel = None
-            group = None
-            groups = {}
-            series = {}
-            for line in file:
-                line = line.strip()
-                if line.startswith("#EXTM3U"):
-                    continue
-                if line.startswith("#EXTINF"):
-                    channel = Channel(provider, line)
-                    self.debug("New channel: ", line)
-                    continue
-                if "://" in line and not (line.startswith("#")):
-                    self.debug("    ", line)
-                    if channel is None:
-                        self.debug("    --> channel is None")
-                        continue
-                    if channel.url is not None:
-                        # We already found the URL, skip the line
-                        self.debug("    --> channel URL was already found")
-                        continue
-                    if channel.name is None or "***" in channel.name:
-                        self.debug("    --> channel name is None")
-                        continue
-                    channel.url = line
-                    self.debug("    --> URL found: ", line)
+    def acquire_process_pool(self):
+        """Return the pool of parsing processes, starting it if needed
 
-                    serie = None
-                    f = SERIES.fullmatch(channel.name)
-                    if f is not None:
-                        res = f.groupdict()
-                        series_name = res['series']
-                        if series_name in series.keys():
-                            serie = series[series_name]
-                        else:
-                            serie = Serie(series_name)
-                            # todo put in group
-                            provider.series.append(serie)
-                            series[series_name] = serie
-                            serie.logo = channel.logo
-                            serie.logo_path = channel.logo_path
-                        season_name = res['season']
-                        if season_name in serie.seasons.keys():
-                            season = serie.seasons[season_name]
-                        else:
-                            season = Season(season_name)
-                            serie.seasons[season_name] = season
-
-                        episode_name = res['episode']
-                        season.episodes[episode_name] = channel
-                        serie.episodes.append(channel)
-
-                    if channel.group_title is not None and channel.group_title.strip() != "":
-                        if group is None or group.name != channel.group_title:
-                            if channel.group_title in groups.keys():
-                                group = groups[channel.group_title]
-                            else:
-                                group = Group(channel.group_title)
-                                provider.groups.append(group)
-                                groups[channel.group_title] = group
-                        if serie is not None and serie not in group.series:
-                            group.series.append(serie)
-                        group.channels.append(channel)
-                        if group.group_type == TV_GROUP:
-                            provider.channels.append(channel)
-                        elif group.group_type == MOVIES_GROUP:
-                            provider.movies.append(channel)
-                    else:
-                        provider.channels.append(channel)
+        The pool has a process per CPU and is shared by the playlists which
+        are parsed at the same time. Each user must call release_process_pool(),
+        the pool is shut down once it isn't used anymore.
+        """
+        with self.process_pool_lock:
+            if self.process_pool is None:
+                # Don't fork the (multi-threaded) application, start the workers from a clean process
+                context = multiprocessing.get_context("forkserver")
+                self.process_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=context)
+            self.process_pool_users += 1
+            return self.process_pool
+
+    def release_process_pool(self):
+        with self.process_pool_lock:
+            self.process_pool_users -= 1
+            if self.process_pool_users > 0:
+                return
+            pool = self.process_pool
+            self.process_pool = None
+        pool.shutdown(cancel_futures=True)
+
+    def read_channels(self, provider, workers=None, indexed=False):
+        """Parse the playlist of a provider
+
+        Compressed playlists are decompressed on the fly. Big uncompressed
+        playlists are split in parts which are parsed by the shared pool of
+        worker processes. The results are yielded in the order of the file,
+        exactly as if it had been parsed in one go.
+
+        Args:
+            provider (Provider): The provider to parse
+            workers (int, optional): Number of parts parsed at the same time. Defaults to
+                the number of CPUs, for playlists of PARALLEL_LOAD_MIN_SIZE or more.
+            indexed (bool, optional): Index the entries instead of parsing them,
+                see read_playlist_entries(). Defaults to False.
+
+        Yields:
+            tuple: (channel, episode) or (entry, episode), see read_playlist_lines()
+        """
+        if is_compressed(provider.path):
+            # Compressed playlists can only be read sequentially
+            workers = 1
+        elif workers is None:
+            workers = os.cpu_count() or 1
+            if os.path.getsize(provider.path) < PARALLEL_LOAD_MIN_SIZE:
+                workers = 1
+        if workers < 2 and indexed:
+            yield from read_playlist_entries(provider.path, 0, os.path.getsize(provider.path), self.debug)
+            return
+        if workers < 2:
+            with open_playlist(provider.path) as file:
+                yield from read_playlist_lines(file, self.debug)
+            return
+
+        ranges = get_playlist_ranges(provider.path, max(workers, os.path.getsize(provider.path) // PARALLEL_LOAD_PART_SIZE))
+        executor = self.acquire_process_pool()
+        results = deque()
+        try:
+            for start, end in ranges:
+                results.append(executor.submit(read_playlist_range, provider.path, start, end, indexed))
+                # Keep a bounded number of parts in memory
+                if len(results) >= workers * 2:
+                    yield from results.popleft().result()
+            while len(results) > 0:
+                yield from results.popleft().result()
+        finally:
+            # Don't leave parts of an interrupted parse in the queue of the other playlists
+            for future in results:
+                future.cancel()
+            self.release_process_pool()
+
+    def load_channels(self, provider, workers=None):
+        for batch in self.load_channels_in_batches(provider, workers=workers):
+            pass
+
+    def load_channels_in_batches(self, provider, batch_size=LOAD_BATCH_SIZE, workers=None, download=None):
+        """Load the channels of a provider incrementally
+
+        Groups, series and channels are added to the provider as soon as they
+        are parsed. Every batch_size channels, the channels, groups and series
+        which were added since the previous batch are yielded, so the caller
+        can show them while the rest of the playlist is still being read.
+
+        Args:
+            provider (Provider): The provider to load
+            batch_size (int, optional): Number of channels per batch. Defaults to LOAD_BATCH_SIZE.
+            workers (int, optional): Number of parsing processes, see read_channels().
+            download (PlaylistDownload, optional): Parse the playlist while it is being
+                downloaded, instead of reading the cached one. Defaults to None.
+
+        Yields:
+            tuple: (channels, groups, series) lists of the new objects (for
+                indexed playlists, channels are PlaylistEntry objects)
+        """
+        new_channels = []
+        new_groups = []
+        new_series = []
+        store = None
+        indexed = False
+        if download is not None:
+            size = download.expected_size
+        else:
+            size = get_playlist_size(provider.path)
+        if size >= CHANNEL_STORE_MIN_SIZE:
+            # Too many channels to keep them all as objects
+            if download is None and os.path.dirname(os.path.abspath(provider.path)) == PROVIDERS_PATH and \
+                not is_compressed(provider.path):
+                # Downloaded playlists are replaced by new files when refreshed,
+                # so they can be memory-mapped and parsed lazily
+                store = PlaylistIndex(provider.path)
+                indexed = True
+            else:
+                store = ChannelStore()
+            provider.channels = ChannelRows(store)
+            provider.movies = ChannelRows(store)
+        group = None
+        groups = {}
+        series = {}
+        if download is not None:
+            channels = read_playlist_lines(download.get_lines(), self.debug)
+        else:
+            channels = self.read_channels(provider, workers, indexed)
+        for channel, episode in channels:
+            in_group = channel.group_title is not None and channel.group_title.strip() != ""
+            if in_group and (group is None or group.name != channel.group_title):
+                if channel.group_title in groups.keys():
+                    group = groups[channel.group_title]
+                else:
+                    group = Group(channel.group_title)
+                    if store is not None:
+                        group.channels = ChannelRows(store)
+                    provider.groups.append(group)
+                    groups[channel.group_title] = group
+                    new_groups.append(group)
+
+            entry = channel
+            if store is not None:
+                entry = store.add(channel, group if in_group else None)
+                if indexed and episode is not None:
+                    # Episodes are kept by their series, parse them now
+                    channel = store.get_channel(entry)
+
+            serie = None
+            if episode is not None:
+                series_name, season_name, episode_name = episode
+                if series_name in series.keys():
+                    serie = series[series_name]
+                else:
+                    serie = Serie(series_name)
+                    # todo put in group
+                    provider.series.append(serie)
+                    series[series_name] = serie
+                    serie.logo = channel.logo
+                    new_series.append(serie)
+                if season_name in serie.seasons.keys():
+                    season = serie.seasons[season_name]
+                else:
+                    season = Season(season_name)
+                    serie.seasons[season_name] = season
+
+                season.episodes[episode_name] = channel
+                serie.episodes.append(channel)
+
+            if in_group:
+                if serie is not None and serie not in group.series:
+                    group.series.append(serie)
+                group.channels.append(entry)
+                if group.group_type == TV_GROUP:
+                    provider.channels.append(entry)
+                elif group.group_type == MOVIES_GROUP:
+                    provider.movies.append(entry)
+            else:
+                provider.channels.append(entry)
+
+            new_channels.append(channel)
+            if len(new_channels) >= batch_size:
+                yield new_channels, new_groups, new_series
+                new_channels = []
+                new_groups = []
+                new_series = []
+
+        if download is not None:
+            download.finish()
+            self.save_validators(provider, download)
+
+        if len(new_channels) > 0 or len(new_groups) > 0 or len(new_series) > 0:
+            yield new_channels, new_groups, new_series
+
+    def get_playlist_checksum(self, path):
+        checksum = hashlib.sha1()
+        with open(path, "rb") as file:
+            for data in iter(lambda: file.read(1024 * 1024), b""):
+                checksum.update(data)
+        return checksum.hexdigest()
+
+    def get_catalog_path(self, provider):
+        return os.path.join(CATALOGS_PATH, slugify(provider.name))
+
+    def save_catalog(self, provider):
+        """Save a snapshot of the parsed catalog of a provider
+
+        The snapshot is keyed on the size, modification time and checksum of
+        the playlist it was parsed from.
+
+        Args:
+            provider (Provider): A provider whose channels were loaded
+        """
+        path = self.get_catalog_path(provider)
+        try:
+            stat = os.stat(provider.path)
+            header = {
+                "version": CATALOG_VERSION,
+                "name": provider.name,
+                "url": provider.url,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime_ns,
+                "checksum": self.get_playlist_checksum(provider.path),
+            }
+            catalog = (provider.groups, provider.channels, provider.movies, provider.series)
+            with open(path + ".tmp", "wb") as file:
+                pickle.dump(header, file, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(catalog, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path + ".tmp", path)
+        except Exception as e:
+            print("Could not save the catalog of %s: %s" % (provider.name, e))
+
+    def load_catalog(self, provider) -> bool:
+        """Load the parsed catalog of a provider from its snapshot
+
+        The snapshot is only used if the playlist has the same size and either
+        the same modification time or the same checksum as when it was saved.
+
+        Args:
+            provider (Provider): The provider to load
+
+        Returns:
+            bool: True if the catalog was loaded, False if the playlist needs to be parsed
+        """
+        path = self.get_catalog_path(provider)
+        if not os.path.exists(path) or not os.path.exists(provider.path):
+            return False
+        try:
+            with open(path, "rb") as file:
+                header = pickle.load(file)
+                if header["version"] != CATALOG_VERSION or header["name"] != provider.name or header["url"] != provider.url:
+                    return False
+                stat = os.stat(provider.path)
+                if stat.st_size != header["size"]:
+                    return False
+                if stat.st_mtime_ns != header["mtime"] and self.get_playlist_checksum(provider.path) != header["checksum"]:
+                    return False
+                provider.groups, provider.channels, provider.movies, provider.series = pickle.load(file)
+            self.debug("Loaded catalog snapshot: %s" % provider.name)
+            return True
+        except Exception as e:
+            print("Could not load the catalog of %s: %s" % (provider.name, e))
+            return False
+
+    def merge_catalog(self, current, provider) -> bool:
+        """Patch the catalog of a provider with a newly parsed version of it
+
+        Channels are matched by URL and name (the tvg-name), then by URL alone
+        and then by name within the same group, so that renamed channels and
+        channels whose URL changed are updated rather than replaced. The Group,
+        Serie, Season and Channel objects of current are kept and updated in
+        place, so that the widgets and the active channel which refer to them
+        stay valid. The lists of current are patched in place too, so this
+        must run where they are read, on the main loop.
+
+        Args:
+            current (Provider): The provider which is currently loaded, it's patched in place
+            provider (Provider): The same provider, freshly parsed
+
+        Returns:
+            bool: True if current was patched, False if it can't be (catalogs kept
+                in a ChannelStore are rebuilt instead)
+        """
+        for catalog in (current, provider):
+            if any(isinstance(channels, ChannelRows) for channels in \
+                [catalog.channels, catalog.movies] + [group.channels for group in catalog.groups]):
+                return False
+
+        old_channels = self.get_catalog_channels(current)
+        by_key = {}
+        by_url = {}
+        by_name = {}
+        for channel in old_channels:
+            by_key.setdefault((channel.url, channel.name), deque()).append(channel)
+            by_url.setdefault(channel.url, deque()).append(channel)
+            by_name.setdefault((channel.group_title, channel.name), deque()).append(channel)
+
+        def pop_unused(channels):
+            while channels:
+                channel = channels.popleft()
+                if id(channel) not in used:
+                    return channel
+            return None
+
+        used = set()
+        matches = {}
+        updated = 0
+        new_channels = self.get_catalog_channels(provider)
+        for new in new_channels:
+            old = pop_unused(by_key.get((new.url, new.name), ()))
+            if old is None:
+                old = pop_unused(by_url.get(new.url, ()))
+            if old is None:
+                old = pop_unused(by_name.get((new.group_title, new.name), ()))
+            if old is None:
+                continue
+            used.add(id(old))
+            matches[id(new)] = old
+            if (old.url, old.name, old.title, old.logo, old.group_title, old._extra) != \
+                (new.url, new.name, new.title, new.logo, new.group_title, new._extra):
+                old.url, old.name, old.title, old.logo, old.group_title, old._extra = \
+                    new.url, new.name, new.title, new.logo, new.group_title, new._extra
+                updated += 1
+
+        def patch(channels):
+            return [matches.get(id(channel), channel) for channel in channels]
+
+        series = {serie.name: serie for serie in current.series}
+        for index, new in enumerate(provider.series):
+            serie = series.get(new.name)
+            if serie is None:
+                continue
+            serie.logo = new.logo
+            seasons = {}
+            for name, new_season in new.seasons.items():
+                season = serie.seasons.get(name, new_season)
+                season.episodes = {episode: matches.get(id(channel), channel) \
+                    for episode, channel in new_season.episodes.items()}
+                seasons[name] = season
+            serie.seasons = seasons
+            serie.episodes[:] = patch(new.episodes)
+            provider.series[index] = serie
+        series = {serie.name: serie for serie in provider.series}
+
+        groups = {group.name: group for group in current.groups}
+        for index, new in enumerate(provider.groups):
+            group = groups.get(new.name, new)
+            group.channels[:] = patch(new.channels)
+            group.series[:] = [series[serie.name] for serie in new.series]
+            provider.groups[index] = group
+
+        current.groups[:] = provider.groups
+        current.channels[:] = patch(provider.channels)
+        current.movies[:] = patch(provider.movies)
+        current.series[:] = provider.series
+        current.modified = provider.modified
+        print("%s: refreshed, %d channels added, %d removed, %d updated, %d unchanged" % (current.name, \
+            len(new_channels) - len(matches), len(old_channels) - len(matches), updated, len(matches) - updated))
+        return True
+
+    def get_catalog_channels(self, provider):
+        """Return the channels, movies and episodes of a provider, without duplicates"""
+        channels = {}
+        lists = [provider.channels, provider.movies] + [group.channels for group in provider.groups] + \
+            [serie.episodes for serie in provider.series]
+        for channel_list in lists:
+            for channel in channel_list:
+                channels[id(channel)] = channel
+        return list(channels.values())
 
     def load_favorites(self):
-        favorites = []
-        with open(FAVORITES_PATH, 'r', encoding="utf-8", errors="ignore") as f:
-            for line in f:
-                favorites.append(line.strip())
+        favorites = Favorites()
+        favorites.load()
         return favorites
-
-    def save_favorites(self, favorites):
-        with open(FAVORITES_PATH, "w", encoding="utf-8") as f:
-            for fav in favorites:
-                f.write(f"{fav}\n")
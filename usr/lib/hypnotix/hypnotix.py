@@ -2,14 +2,16 @@
 import gettext
 import locale
 import os
-import shutil
 import sys
 import time
 import traceback
 import warnings
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from functools import partial
-from pathlib import Path
+from itertools import islice
 
 # Force X11 on a Wayland session
 if "WAYLAND_DISPLAY" in os.environ:
@@ -22,15 +24,14 @@ import gi
 
 gi.require_version("Gtk", "3.0")
 gi.require_version("XApp", "1.0")
-from gi.repository import Gtk, Gdk, Gio, XApp, GdkPixbuf, GLib, Pango
+from gi.repository import Gtk, Gdk, Gio, XApp, GdkPixbuf, GLib, GObject, Pango
 
 import mpv
-import requests
 import setproctitle
 from unidecode import unidecode
 
-from common import Manager, Provider, Channel, MOVIES_GROUP, PROVIDERS_PATH, SERIES_GROUP, TV_GROUP,\
-    async_function, idle_function
+from common import Favorites, Manager, PlaylistDownload, Provider, ThumbnailPack, LOGOS_PATH, MOVIES_GROUP, PROVIDERS_PATH, \
+    SERIES_GROUP, TV_GROUP, async_function, get_logo_path, get_resident_memory, idle_function, search_channels
 
 
 setproctitle.setproctitle("hypnotix")
@@ -58,6 +59,26 @@ PROVIDER_TYPE_XTREAM = "xtream"
 
 UPDATE_BR_INTERVAL = 5
 
+# Logos more than this many pages away from the viewport aren't downloaded
+LOGO_PREFETCH_PAGES = 3
+# Delay before updating the logo priorities after scrolling, in ms
+LOGO_PRIORITY_DELAY = 100
+
+# Widgets added to the channel list and to the VOD and episode grids at a time,
+# when they're shown and when scrolling near their end
+LIST_CHUNK_SIZE = 200
+
+# Time spent building widgets before handing the main loop back for input and redraws, in seconds
+FRAME_BUDGET = 0.008
+# Pages are built by jobs which are cancelled when going back up to a less deep page
+PAGE_DEPTHS = {"landing_page": 0, "categories_page": 1, "channels_page": 2, "vod_page": 2, "episodes_page": 3}
+
+# Number of providers loaded at the same time
+PROVIDER_LOAD_WORKERS = 4
+
+# Memory used by decoded images kept in SurfaceCache, in bytes
+SURFACE_CACHE_SIZE = 64 * 1024 * 1024
+
 AUDIO_SAMPLE_FORMATS = {
     "u16": "unsigned 16 bits",
     "s16": "signed 16 bits",
@@ -100,6 +121,257 @@ class ChannelWidget(Gtk.ListBoxRow):
     def channel(self):
         return self._channel
 
+class ModelItem(GObject.Object):
+    """ A channel, movie, series or episode, as an item of a Gio.ListStore. """
+
+    def __init__(self, item):
+        super().__init__()
+        self.item = item
+
+class WidgetScheduler:
+    """ Builds widgets on the main loop in chunks which fit in a frame budget.
+
+    A job is an iterable which builds one widget per step. Its steps run from an idle
+    callback until FRAME_BUDGET is used, then the main loop gets to handle input and
+    redraws before the next chunk. Starting a job cancels the unfinished job of the
+    same name, and jobs which build a page are cancelled when going back up from it.
+    """
+
+    def __init__(self, budget=FRAME_BUDGET):
+        self.budget = budget
+        # name -> job
+        self.jobs = {}
+
+    def run(self, name, steps, page=None, on_chunk=None):
+        """Start a job
+
+        Args:
+            name (str): The name of the job, it replaces the unfinished job with the same name
+            steps (iterable): Each step builds a widget
+            page (str, optional): The page the job builds, see PAGE_DEPTHS. Defaults to None.
+            on_chunk (function, optional): Called after each chunk of steps. Defaults to None.
+        """
+        self.cancel(name)
+        job = {"name": name, "steps": iter(steps), "page": page, "on_chunk": on_chunk, \
+            "start": time.monotonic(), "count": 0, "chunks": 0}
+        job["source"] = GLib.idle_add(self.run_chunk, job)
+        self.jobs[name] = job
+
+    def is_running(self, name):
+        return name in self.jobs
+
+    def cancel(self, name):
+        job = self.jobs.pop(name, None)
+        if job is not None:
+            GLib.source_remove(job["source"])
+
+    def on_page_shown(self, page):
+        """Cancel the jobs which build pages deeper than page"""
+        depth = PAGE_DEPTHS.get(page)
+        if depth is None:
+            return
+        for name, job in list(self.jobs.items()):
+            if job["page"] in PAGE_DEPTHS and PAGE_DEPTHS[job["page"]] > depth:
+                self.cancel(name)
+
+    def run_chunk(self, job):
+        deadline = time.monotonic() + self.budget
+        job["chunks"] += 1
+        finished = True
+        try:
+            for _ in job["steps"]:
+                job["count"] += 1
+                if time.monotonic() >= deadline:
+                    finished = False
+                    break
+            if job["on_chunk"] is not None:
+                job["on_chunk"]()
+        except Exception:
+            traceback.print_exc()
+            print("%s: failed after %d widgets" % (job["name"], job["count"]))
+            # Returning False removes the idle source, the job can be started again
+            if self.jobs.get(job["name"]) is job:
+                del self.jobs[job["name"]]
+            return False
+        if not finished:
+            return True
+        if self.jobs.get(job["name"]) is job:
+            del self.jobs[job["name"]]
+        print("%s: %d widgets built in %.1f ms, over %d frames" % (job["name"], job["count"], \
+            (time.monotonic() - job["start"]) * 1000, job["chunks"]))
+        return False
+
+class LazyListView:
+    """ Shows a list of items in a Gtk.ListBox or Gtk.FlowBox, creating their widgets as they're scrolled to.
+
+    The box is bound to a Gio.ListStore which receives the items in chunks of LIST_CHUNK_SIZE:
+    one when the list is set, then one whenever the view gets within two pages of its end.
+    The items of a chunk are added by a WidgetScheduler job, within the frame budget, which
+    is restarted by resume() when it was cancelled before adding them all.
+    GTK3 list and flow boxes destroy the widgets of removed items, so widgets aren't recycled.
+
+    create_widget(item) returns a (widget, channel, image) tuple, the channel and image being
+    the logo to show. on_widgets_added(logos, append) is called with the list of (channel, image)
+    tuples added by each chunk of the job, append being False for the first one of a list.
+    """
+
+    def __init__(self, box, create_widget, on_widgets_added, scheduler, name, page, scroll=True):
+        self.box = box
+        self.create_widget = create_widget
+        self.on_widgets_added = on_widgets_added
+        self.scheduler = scheduler
+        self.name = name
+        self.page = page
+        self.items = []
+        # Number of items which were requested, the store catches up with it
+        self.target = 0
+        self.new_logos = []
+        self.append = False
+        self.store = Gio.ListStore.new(ModelItem)
+        self.box.bind_model(self.store, self.create)
+        if scroll:
+            adjustment = box.get_ancestor(Gtk.ScrolledWindow).get_vadjustment()
+            adjustment.connect("value-changed", self.on_scrolled)
+            adjustment.connect("changed", self.on_scrolled)
+
+    def set_items(self, items):
+        self.clear()
+        self.items = items
+        self.append = False
+        self.add_items()
+        self.box.get_ancestor(Gtk.ScrolledWindow).get_vadjustment().set_value(0)
+
+    def clear(self):
+        self.scheduler.cancel(self.name)
+        self.items = []
+        self.target = 0
+        self.new_logos = []
+        self.store.remove_all()
+
+    def is_complete(self):
+        return self.target >= len(self.items)
+
+    def add_items(self, count=LIST_CHUNK_SIZE):
+        """Add the next count items to the box
+
+        Returns:
+            int: The number of items which will be added
+        """
+        start = self.target
+        self.target = min(len(self.items), self.target + count)
+        self.resume()
+        return self.target - start
+
+    def resume(self):
+        """Start the job which adds the requested items, unless it is running or they were all added"""
+        if self.store.get_n_items() < self.target and not self.scheduler.is_running(self.name):
+            self.scheduler.run(self.name, self.build(), self.page, self.flush_logos)
+
+    def build(self):
+        while self.store.get_n_items() < self.target:
+            # The widget is created by create()
+            self.store.append(ModelItem(self.items[self.store.get_n_items()]))
+            yield
+
+    def flush_logos(self):
+        if len(self.new_logos) > 0 or not self.append:
+            self.on_widgets_added(self.new_logos, self.append)
+            self.append = True
+        self.new_logos = []
+
+    def create(self, model_item):
+        widget, channel, image = self.create_widget(model_item.item)
+        self.new_logos.append((channel, image))
+        widget.show_all()
+        return widget
+
+    def on_scrolled(self, adjustment):
+        if not self.box.get_mapped():
+            # Hidden page
+            return
+        if self.store.get_n_items() < self.target:
+            # The previous chunk is still being added, or its job was cancelled
+            self.resume()
+        elif not self.is_complete() and \
+                adjustment.get_value() + 2 * adjustment.get_page_size() >= adjustment.get_upper():
+            self.add_items()
+
+class PageLogos:
+    """ The logos of a scrolled page which still need to be downloaded.
+
+    Each page keeps its own, so that its downloads can be dropped while it is hidden and
+    queued again, ranked by the position of their images, when it is shown again.
+    """
+
+    def __init__(self, container, page):
+        self.container = container
+        self.page = page
+        # path -> list of (channel, image) tuples waiting for the logo
+        self.images = {}
+        # paths being downloaded, or queued in the LogoDownloader
+        self.pending = set()
+        self.source = None
+        self.headers = {}
+        # The type of content shown when the page was filled, it gives the size of the logos
+        self.content_type = None
+        self.timer = None
+
+class SurfaceCache:
+    """ A cache of the cairo surfaces of decoded image files, with a size limit.
+
+    Surfaces are keyed by file, size and scale factor and the least recently used
+    ones are dropped first. A file which changed since it was decoded is decoded again.
+    Downloaded logos are decoded from their thumbnails when there's a ThumbnailPack.
+    """
+
+    def __init__(self, max_size=SURFACE_CACHE_SIZE, thumbnails=None):
+        self.max_size = max_size
+        self.thumbnails = thumbnails
+        self.size = 0
+        # (filename, width, height, scale) -> (mtime, surface, size)
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, filename, width, height, scale):
+        key = (filename, width, height, scale)
+        mtime = os.stat(filename).st_mtime_ns
+        entry = self.surfaces.get(key)
+        if entry is not None and entry[0] == mtime:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        pixbuf = self.load_pixbuf(filename, width, height, scale, mtime)
+        surface = Gdk.cairo_surface_create_from_pixbuf(pixbuf, scale)
+        size = pixbuf.get_width() * pixbuf.get_height() * 4
+        if entry is not None:
+            self.size -= entry[2]
+        self.surfaces[key] = (mtime, surface, size)
+        self.surfaces.move_to_end(key)
+        self.size += size
+        while self.size > self.max_size and len(self.surfaces) > 1:
+            _, (_, _, evicted_size) = self.surfaces.popitem(last=False)
+            self.size -= evicted_size
+        return surface
+
+    def load_pixbuf(self, filename, width, height, scale, mtime):
+        if self.thumbnails is None or os.path.dirname(filename) != LOGOS_PATH:
+            return GdkPixbuf.Pixbuf.new_from_file_at_size(filename, width, height)
+        key = "%s:%d:%d:%d" % (os.path.basename(filename), width, height, scale)
+        thumbnail = self.thumbnails.get(key, mtime)
+        if thumbnail is not None:
+            pixels, thumbnail_width, thumbnail_height, rowstride, has_alpha = thumbnail
+            return GdkPixbuf.Pixbuf.new_from_bytes(GLib.Bytes.new(pixels), GdkPixbuf.Colorspace.RGB, has_alpha, 8, \
+                thumbnail_width, thumbnail_height, rowstride)
+        pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(filename, width, height)
+        try:
+            self.thumbnails.add(key, mtime, pixbuf.read_pixel_bytes().get_data(), pixbuf.get_width(), \
+                pixbuf.get_height(), pixbuf.get_rowstride(), pixbuf.get_has_alpha())
+        except Exception as e:
+            print("Could not store the thumbnail of %s: %s" % (filename, e))
+        return pixbuf
+
 class MyApplication(Gtk.Application):
     # Main initialization routine
     def __init__(self, application_id, flags):
@@ -126,7 +398,7 @@ class MainWindow:
         self.icon_theme = Gtk.IconTheme.get_default()
         self.manager = Manager(self.settings)
         self.providers = []
-        self.favorite_data = []
+        self.favorite_data = Favorites()
         self.active_provider = None
         self.active_group = None
         self.active_serie = None
@@ -148,6 +420,16 @@ class MainWindow:
         # Used for redownloading timer
         self.reload_timeout_sec = 60 * 5
         self._timerid = -1
+        self.xtreams = {}
+
+        # Logos which are being downloaded, by scrolled widget, see PageLogos
+        self.page_logos = {}
+
+        # Decoded logos and posters
+        self.surface_cache = SurfaceCache(thumbnails=ThumbnailPack())
+
+        # Builds pages without blocking the main loop
+        self.widget_scheduler = WidgetScheduler()
         gladefile = "/usr/share/hypnotix/hypnotix.ui"
         self.builder = Gtk.Builder()
         self.builder.set_translation_domain(APP)
@@ -318,7 +600,31 @@ class MainWindow:
 
         self.browse_button.connect("clicked", self.on_browse_button)
 
+        # Groups of the categories page, the ones parsed while it is shown are added to it
+        self.category_groups = []
+
         self.channels_listbox.connect("row-activated", self.on_channel_activated)
+        # Widgets are only created for the items which were scrolled to
+        self.channels_logo_source = None
+        self.channels_view = LazyListView(self.channels_listbox, self.create_channel_row, \
+            lambda logos, append: self.download_channel_logos(logos, self.channels_listbox, self.channels_logo_source, append), \
+            self.widget_scheduler, "channels", "channels_page")
+        self.vod_view = LazyListView(self.vod_flowbox, self.create_vod_button, \
+            lambda logos, append: self.download_channel_logos(logos, self.vod_flowbox, None, append), \
+            self.widget_scheduler, "vod", "vod_page")
+        # One view per season, filled in order
+        self.season_views = []
+        self.pending_seasons = []
+        adjustment = self.episodes_box.get_ancestor(Gtk.ScrolledWindow).get_vadjustment()
+        adjustment.connect("value-changed", self.on_episodes_scrolled)
+        adjustment.connect("changed", self.on_episodes_scrolled)
+        for widget, page in [(self.channels_listbox, "channels_page"), (self.vod_flowbox, "vod_page"), \
+            (self.episodes_box, "episodes_page")]:
+            logos = PageLogos(widget, page)
+            self.page_logos[widget] = logos
+            adjustment = widget.get_ancestor(Gtk.ScrolledWindow).get_vadjustment()
+            adjustment.connect("value-changed", self.on_logo_viewport_changed, logos)
+            adjustment.connect("changed", self.on_logo_viewport_changed, logos)
 
         self.favorite_button.connect("toggled", self.on_favorite_button_toggled)
 
@@ -417,9 +723,7 @@ class MainWindow:
         if height != -1:
             height = height * scale
 
-        pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(filename, width, height)
-        surface = Gdk.cairo_surface_create_from_pixbuf(pixbuf, scale)
-        return surface
+        return self.surface_cache.get(filename, width, height, scale)
 
     def get_surf_based_image(self, filename, width, height):
         surf = self.get_surface_for_file(filename, width, height)
@@ -457,11 +761,32 @@ class MainWindow:
         for child in self.categories_flowbox.get_children():
             self.categories_flowbox.remove(child)
         self.active_group = None
-        found_groups = False
-        for group in self.active_provider.groups:
-            if group.group_type != self.content_type:
-                continue
-            found_groups = True
+        groups = [group for group in self.active_provider.groups if group.group_type == self.content_type]
+        self.category_groups = groups
+        if len(groups) > 0:
+            self.widget_scheduler.run("groups", self.build_category_buttons(groups), "categories_page")
+        else:
+            self.widget_scheduler.cancel("groups")
+            self.on_category_button_clicked(None, None)
+
+    @idle_function
+    def add_category_groups(self, provider, groups):
+        """Add the groups parsed while the categories page of their provider is shown"""
+        if provider is not self.active_provider or self.stack.get_visible_child_name() != "categories_page":
+            return
+        shown = set(self.category_groups)
+        groups = [group for group in groups if group.group_type == self.content_type and group not in shown]
+        if len(groups) == 0:
+            return
+        start = len(self.category_groups)
+        # A running job goes through this list, it builds them too
+        self.category_groups.extend(groups)
+        if not self.widget_scheduler.is_running("groups"):
+            self.widget_scheduler.run("groups", self.build_category_buttons(islice(self.category_groups, start, None)), \
+                "categories_page")
+
+    def build_category_buttons(self, groups):
+        for group in groups:
             button = Gtk.Button()
             button.connect("clicked", self.on_category_button_clicked, group)
             label = Gtk.Label()
@@ -489,11 +814,8 @@ class MainWindow:
             box.set_spacing(6)
             button.add(box)
             self.categories_flowbox.add(button)
-
-        self.categories_flowbox.show_all()
-
-        if not found_groups:
-            self.on_category_button_clicked(None, None)
+            button.show_all()
+            yield
 
     def on_category_button_clicked(self, widget, group):
         self.active_group = group
@@ -515,61 +837,44 @@ class MainWindow:
 
     def show_favorites(self, widget=None):
         self.content_type = TV_GROUP
-        channels = []
-        for line in self.favorite_data:
-            info, url = line.split(":::")
-            channel = Channel(None, info)
-            channel.url = url
-            channels.append(channel)
-        self.show_channels(channels, favorites=True)
+        self.show_channels(self.favorite_data.get_channels(), favorites=True)
 
     def show_channels(self, channels, favorites=False):
         self.navigate_to("channels_page", "", favorites)
         if self.content_type == TV_GROUP:
             self.sidebar.show()
-            for child in self.channels_listbox.get_children():
-                self.channels_listbox.remove(child)
-
-            logos_to_refresh = []
-            for channel in channels:
-                image = Gtk.Image().new_from_surface(self.get_channel_surface(channel.logo_path))
-                logos_to_refresh.append((channel, image))
-                self.channels_listbox.add(ChannelWidget(channel, image))
-
-            self.channels_listbox.show_all()
-            self.visible_search_results = len(self.channels_listbox.get_children())
-            if len(logos_to_refresh) > 0:
-                self.download_channel_logos(logos_to_refresh)
+            self.channels_logo_source = "favorites" if favorites else None
+            self.visible_search_results = len(channels)
+            self.channels_view.set_items(channels)
         else:
             self.sidebar.hide()
 
+    def create_channel_row(self, channel):
+        image = Gtk.Image().new_from_surface(self.get_channel_surface(get_logo_path(channel.logo)))
+        return ChannelWidget(channel, image), channel, image
+
     def show_vod(self, items):
-        logos_to_refresh = []
         self.navigate_to("vod_page")
-        for child in self.vod_flowbox.get_children():
-            self.vod_flowbox.remove(child)
-        for item in items:
-            button = Gtk.Button()
-            button.set_tooltip_text(item.name)
-            if self.content_type == MOVIES_GROUP:
-                button.connect("clicked", self.on_vod_movie_button_clicked, item)
-            else:
-                button.connect("clicked", self.on_vod_series_button_clicked, item)
-            label = Gtk.Label()
-            label.set_text(item.name)
-            label.set_max_width_chars(30)
-            label.set_ellipsize(Pango.EllipsizeMode.END)
-            box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
-            image = Gtk.Image().new_from_surface(self.get_channel_surface(item.logo_path))
-            logos_to_refresh.append((item, image))
-            box.pack_start(image, False, False, 0)
-            box.pack_start(label, False, False, 0)
-            box.set_spacing(6)
-            button.add(box)
-            self.vod_flowbox.add(button)
-        self.vod_flowbox.show_all()
-        if len(logos_to_refresh) > 0:
-            self.download_channel_logos(logos_to_refresh)
+        self.vod_view.set_items(items)
+
+    def create_vod_button(self, item):
+        button = Gtk.Button()
+        button.set_tooltip_text(item.name)
+        if self.content_type == MOVIES_GROUP:
+            button.connect("clicked", self.on_vod_movie_button_clicked, item)
+        else:
+            button.connect("clicked", self.on_vod_series_button_clicked, item)
+        label = Gtk.Label()
+        label.set_text(item.name)
+        label.set_max_width_chars(30)
+        label.set_ellipsize(Pango.EllipsizeMode.END)
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        image = Gtk.Image().new_from_surface(self.get_channel_surface(get_logo_path(item.logo)))
+        box.pack_start(image, False, False, 0)
+        box.pack_start(label, False, False, 0)
+        box.set_spacing(6)
+        button.add(box)
+        return button, item, image
 
     def remove_word(self, word, string):
         if " " not in string:
@@ -580,45 +885,77 @@ class MainWindow:
         return " ".join(words)
 
     def show_episodes(self, serie):
-        logos_to_refresh = []
         self.active_serie = serie
         # If we are using xtream provider
         # Load every Episodes of every Season for this Series
         if self.active_provider.type_id == "xtream":
-            self.x.get_series_info_by_id(self.active_serie)
+            self.xtreams[self.active_provider.name].get_series_info_by_id(self.active_serie)
 
         self.navigate_to("episodes_page")
+        for view in self.season_views:
+            view.clear()
         for child in self.episodes_box.get_children():
             self.episodes_box.remove(child)
-        for season_name in serie.seasons.keys():
-            season = serie.seasons[season_name]
-            label = Gtk.Label()
-            label.set_text(_("Season %s") % season_name)
-            label.get_style_context().add_class("season-label")
-            flowbox = Gtk.FlowBox()
-            self.episodes_box.pack_start(label, False, False, 0)
-            self.episodes_box.pack_start(flowbox, False, False, 0)
-            for episode_name in season.episodes.keys():
-                episode = season.episodes[episode_name]
-                button = Gtk.Button()
-                button.set_tooltip_text(episode_name)
-                button.connect("clicked", self.on_episode_button_clicked, episode)
+        # Forget about the logos of the previous page
+        self.download_channel_logos([], self.episodes_box)
+        self.season_views = []
+        self.pending_seasons = list(serie.seasons.items())
+        self.add_episodes()
+        self.episodes_box.get_ancestor(Gtk.ScrolledWindow).get_vadjustment().set_value(0)
+
+    def resume_seasons(self):
+        """Finish adding the requested episodes of the seasons whose job was cancelled"""
+        for view in self.season_views:
+            view.resume()
+
+    def add_episodes(self, count=LIST_CHUNK_SIZE):
+        """Add the next count episodes to the episodes page, adding seasons as needed"""
+        self.resume_seasons()
+        while count > 0:
+            if len(self.season_views) == 0 or self.season_views[-1].is_complete():
+                if len(self.pending_seasons) == 0:
+                    break
+                season_name, season = self.pending_seasons.pop(0)
                 label = Gtk.Label()
-                label.set_text(_("Episode %s") % episode_name)
-                label.set_max_width_chars(30)
-                label.set_ellipsize(Pango.EllipsizeMode.END)
-                box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
-                image = Gtk.Image().new_from_surface(self.get_channel_surface(episode.logo_path))
-                logos_to_refresh.append((episode, image))
-                box.pack_start(image, False, False, 0)
-                box.pack_start(label, False, False, 0)
-                box.set_spacing(6)
-                button.add(box)
-                flowbox.add(button)
-        self.episodes_box.show_all()
+                label.set_text(_("Season %s") % season_name)
+                label.get_style_context().add_class("season-label")
+                flowbox = Gtk.FlowBox()
+                self.episodes_box.pack_start(label, False, False, 0)
+                self.episodes_box.pack_start(flowbox, False, False, 0)
+                label.show()
+                flowbox.show()
+                view = LazyListView(flowbox, self.create_episode_button, \
+                    lambda logos, append: self.download_channel_logos(logos, self.episodes_box, append=True), \
+                    self.widget_scheduler, "season %s" % season_name, "episodes_page", scroll=False)
+                view.items = list(season.episodes.items())
+                self.season_views.append(view)
+            count -= self.season_views[-1].add_items(count)
+
+    def create_episode_button(self, item):
+        episode_name, episode = item
+        button = Gtk.Button()
+        button.set_tooltip_text(episode_name)
+        button.connect("clicked", self.on_episode_button_clicked, episode)
+        label = Gtk.Label()
+        label.set_text(_("Episode %s") % episode_name)
+        label.set_max_width_chars(30)
+        label.set_ellipsize(Pango.EllipsizeMode.END)
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        image = Gtk.Image().new_from_surface(self.get_channel_surface(get_logo_path(episode.logo)))
+        box.pack_start(image, False, False, 0)
+        box.pack_start(label, False, False, 0)
+        box.set_spacing(6)
+        button.add(box)
+        return button, episode, image
 
-        if len(logos_to_refresh) > 0:
-            self.download_channel_logos(logos_to_refresh)
+    def on_episodes_scrolled(self, adjustment):
+        if not self.episodes_box.get_mapped():
+            return
+        self.resume_seasons()
+        if len(self.pending_seasons) == 0 and (len(self.season_views) == 0 or self.season_views[-1].is_complete()):
+            return
+        if adjustment.get_value() + 2 * adjustment.get_page_size() >= adjustment.get_upper():
+            self.add_episodes()
 
     def on_vod_movie_button_clicked(self, widget, channel):
         self.active_channel = channel
@@ -655,36 +992,148 @@ class MainWindow:
             subprocess.getoutput("chmod a+rx ./yt-dlp")
         self.ytdlp_local_version_label.set_text(subprocess.getoutput("~/.cache/hypnotix/yt-dlp/yt-dlp --version"))
 
-    @async_function
-    def download_channel_logos(self, logos_to_refresh):
-        headers = {
-            "User-Agent": self.settings.get_string("user-agent"),
-            "Referer": self.settings.get_string("http-referer"),
-        }
+    def download_channel_logos(self, logos_to_refresh, container, source=None, append=False):
+        """Download the missing logos of a page, the visible ones first
+
+        Args:
+            logos_to_refresh (list): (channel, image) tuples of the page
+            container (Gtk.Widget): The scrolled widget which contains the images
+            source (str, optional): Name of the provider the logos are for. Defaults to the active provider.
+            append (bool, optional): The images were added to the page. Defaults to False.
+        """
+        logos = self.page_logos[container]
+        if not append:
+            # Forget about the logos of the previous content of the page
+            self.drop_logo_downloads(logos)
+            logos.headers = {
+                "User-Agent": self.settings.get_string("user-agent"),
+                "Referer": self.settings.get_string("http-referer"),
+            }
+            logos.source = self.active_provider.name if source is None else source
+            logos.content_type = self.content_type
+            logos.images = {}
         for channel, image in logos_to_refresh:
-            if channel.logo_path is None:
+            path = get_logo_path(channel.logo)
+            if path is None or not channel.logo.startswith(("http://", "https://")):
+                # No logo, or a local one
                 continue
-            if os.path.isfile(channel.logo_path):
+            if path in logos.images:
+                logos.images[path].append((channel, image))
+            elif self.manager.logo_cache.is_failing(path):
+                # Broken logo, wait before trying again
                 continue
-            try:
-                response = requests.get(channel.logo, headers=headers, timeout=10, stream=True)
-                if response.status_code == 200:
-                    response.raw.decode_content = True
-                    with open(channel.logo_path, "wb") as f:
-                        shutil.copyfileobj(response.raw, f)
-                        self.refresh_channel_logo(channel, image)
-            except Exception as e:
-                print(e)
+            elif not self.manager.logo_cache.lookup(path, logos.source):
+                logos.images[path] = [(channel, image)]
+        # The images aren't laid out yet, start in list order and
+        # use their position once they are
+        self.update_logo_priorities(logos)
+        self.on_logo_viewport_changed(None, logos)
+
+    def drop_logo_downloads(self, logos):
+        """Drop the queued downloads of a page, the ones in progress still update its images"""
+        dropped = self.manager.logo_downloader.reprioritize({path: None for path in logos.pending})
+        # The downloads are shared with the other pages which wanted the same logos
+        for page_logos in self.page_logos.values():
+            page_logos.pending -= dropped
+
+    def is_logo_page_shown(self, logos):
+        if self.stack.get_visible_child_name() != logos.page:
+            return False
+        # Movies and episodes are played on the channels page, without the list of channels
+        return logos.page != "channels_page" or self.content_type == TV_GROUP
+
+    def on_logo_page_shown(self):
+        """Drop the logo downloads of the hidden pages, queue the missing logos of the shown one"""
+        for logos in self.page_logos.values():
+            if self.is_logo_page_shown(logos):
+                self.on_logo_viewport_changed(None, logos)
+            else:
+                self.drop_logo_downloads(logos)
+
+    def get_logo_priority(self, image, top, page_size, container):
+        """Return the download priority of the logo of an image, from its position in the viewport
+
+        Returns:
+            int: 0 for visible images, then 1 + the number of pages to scroll to see them,
+                or None if they are too far away to be downloaded for now
+        """
+        coordinates = image.translate_coordinates(container, 0, 0)
+        if coordinates is None:
+            return None
+        y = coordinates[1]
+        if y + image.get_allocated_height() >= top and y <= top + page_size:
+            return 0
+        distance = top - y - image.get_allocated_height() if y < top else y - top - page_size
+        priority = 1 + int(distance // page_size)
+        if priority > LOGO_PREFETCH_PAGES:
+            return None
+        return priority
+
+    def update_logo_priorities(self, logos):
+        logos.timer = None
+        if len(logos.images) == 0 or not self.is_logo_page_shown(logos):
+            return False
+        adjustment = logos.container.get_ancestor(Gtk.ScrolledWindow).get_vadjustment()
+        top = adjustment.get_value()
+        page_size = adjustment.get_page_size()
+        laid_out = page_size > 0 and logos.container.get_allocated_height() > 1
+        priorities = {}
+        downloader = self.manager.logo_downloader
+        for index, (path, images) in enumerate(list(logos.images.items())):
+            if laid_out:
+                priority = None
+                for channel, image in images:
+                    image_priority = self.get_logo_priority(image, top, page_size, logos.container)
+                    if image_priority is not None and (priority is None or image_priority < priority):
+                        priority = image_priority
+            else:
+                priority = index
+            if path in logos.pending:
+                priorities[path] = priority
+            elif priority is None:
+                continue
+            elif self.manager.logo_cache.lookup(path, logos.source):
+                # Downloaded for another page
+                self.set_logo_images(logos, path)
+            else:
+                logos.pending.add(path)
+                downloader.download(images[0][0].logo, path, logos.source, logos.headers, \
+                    partial(self.on_logo_downloaded, logos, path), priority)
+        dropped = downloader.reprioritize(priorities)
+        for page_logos in self.page_logos.values():
+            page_logos.pending -= dropped
+        return False
+
+    def on_logo_viewport_changed(self, adjustment, logos):
+        if len(logos.images) == 0:
+            return
+        # Wait for scrolling to settle before updating the priorities
+        if logos.timer is not None:
+            GLib.source_remove(logos.timer)
+        logos.timer = GLib.timeout_add(LOGO_PRIORITY_DELAY, self.update_logo_priorities, logos)
 
     @idle_function
-    def refresh_channel_logo(self, channel, image):
-        image.set_from_surface(self.get_channel_surface(channel.logo_path))
+    def on_logo_downloaded(self, logos, path, stored):
+        logos.pending.discard(path)
+        if not stored:
+            # The images keep the generic logo, the failure is
+            # remembered by the logo cache until it can be retried
+            logos.images.pop(path, None)
+            return
+        self.set_logo_images(logos, path)
 
-    def get_channel_surface(self, path):
+    def set_logo_images(self, logos, path):
+        """Show a downloaded logo in the images of a page which were waiting for it"""
+        for channel, image in logos.images.pop(path, []):
+            image.set_from_surface(self.get_channel_surface(path, logos.content_type))
+
+    def get_channel_surface(self, path, content_type=None):
+        if content_type is None:
+            content_type = self.content_type
         try:
-            if self.content_type == TV_GROUP:
+            if content_type == TV_GROUP:
                 surface = self.get_surface_for_file(path, 64, 32)
-            elif self.content_type == MOVIES_GROUP:
+            elif content_type == MOVIES_GROUP:
                 surface = self.get_surface_for_file(path, 200, 200)
             else:
                 surface = self.get_surface_for_file(path, 200, 200)
@@ -716,10 +1165,7 @@ class MainWindow:
 
     def on_search(self):
         self.visible_search_results = 0
-        channels = []
-        for channel in self.active_provider.channels:
-            if self.latest_search_bar_text in channel.name.lower():
-                channels.append(channel)
+        channels = search_channels(self.active_provider.channels, self.latest_search_bar_text)
         self.show_channels(channels)
         if self.visible_search_results == 0:
             self.status(_("No channels found"))
@@ -732,8 +1178,7 @@ class MainWindow:
     def init_channels_listbox(self):
         self.latest_search_bar_text = None
         self.active_group = None
-        for child in self.channels_listbox.get_children():
-            self.channels_listbox.remove(child)
+        self.channels_view.clear()
         self.visible_search_results = 0
 
     @idle_function
@@ -742,27 +1187,16 @@ class MainWindow:
         self.search_button.show()
         self.fullscreen_button.hide()
         self.stack.set_visible_child_name(page)
+        if page != "channels_page" or self.content_type == TV_GROUP:
+            # Movies and episodes are played on the channels page, keep building the page they were picked from
+            self.widget_scheduler.on_page_shown(page)
+        self.on_logo_page_shown()
         provider = self.active_provider
         self.back_page = "landing_page"
         if page == "landing_page":
             self.headerbar.set_title("Hypnotix")
             self.headerbar.set_subtitle(_("Watch TV"))
-            if provider is None:
-                self.current_provider_label.set_text(_("No provider selected"))
-                self.tv_label.set_text(_("TV Channels (%d)") % 0)
-                self.movies_label.set_text(_("Movies (%d)") % 0)
-                self.series_label.set_text(_("Series (%d)") % 0)
-                self.tv_button.set_sensitive(False)
-                self.movies_button.set_sensitive(False)
-                self.series_button.set_sensitive(False)
-            else:
-                self.current_provider_label.set_text(provider.name)
-                self.tv_label.set_text(_("TV Channels (%d)") % len(provider.channels))
-                self.movies_label.set_text(_("Movies (%d)") % len(provider.movies))
-                self.series_label.set_text(_("Series (%d)") % len(provider.series))
-                self.tv_button.set_sensitive(len(provider.channels) > 0)
-                self.movies_button.set_sensitive(len(provider.movies) > 0)
-                self.series_button.set_sensitive(len(provider.series) > 0)
+            self.update_landing_page()
             self.go_back_button.hide()
         elif page == "categories_page":
             self.headerbar.set_title(provider.name)
@@ -775,6 +1209,8 @@ class MainWindow:
         elif page == "channels_page":
             self.fullscreen_button.show()
             self.playback_bar.hide()
+            if self.content_type == TV_GROUP:
+                self.channels_view.resume()
             if favorites:
                 self.headerbar.set_title("Hypnotix")
                 self.headerbar.set_subtitle(_("Favorites"))
@@ -793,6 +1229,7 @@ class MainWindow:
                     self.headerbar.set_subtitle(self.active_channel.name)
                     self.back_page = "episodes_page"
         elif page == "vod_page":
+            self.vod_view.resume()
             self.headerbar.set_title(provider.name)
             if self.content_type == MOVIES_GROUP:
                 if self.active_group is None:
@@ -807,6 +1244,7 @@ class MainWindow:
                     self.back_page = "categories_page"
                     self.headerbar.set_subtitle(_("Series > %s") % self.active_group.name)
         elif page == "episodes_page":
+            self.resume_seasons()
             self.back_page = "vod_page"
             self.headerbar.set_title(provider.name)
             self.headerbar.set_subtitle(self.active_serie.name)
@@ -835,6 +1273,31 @@ class MainWindow:
             self.headerbar.set_title("Hypnotix")
             self.headerbar.set_subtitle(_("Reset providers"))
 
+    def update_landing_page(self):
+        provider = self.active_provider
+        if provider is None:
+            self.current_provider_label.set_text(_("No provider selected"))
+            self.tv_label.set_text(_("TV Channels (%d)") % 0)
+            self.movies_label.set_text(_("Movies (%d)") % 0)
+            self.series_label.set_text(_("Series (%d)") % 0)
+            self.tv_button.set_sensitive(False)
+            self.movies_button.set_sensitive(False)
+            self.series_button.set_sensitive(False)
+        else:
+            self.current_provider_label.set_text(provider.name)
+            self.tv_label.set_text(_("TV Channels (%d)") % len(provider.channels))
+            self.movies_label.set_text(_("Movies (%d)") % len(provider.movies))
+            self.series_label.set_text(_("Series (%d)") % len(provider.series))
+            self.tv_button.set_sensitive(len(provider.channels) > 0)
+            self.movies_button.set_sensitive(len(provider.movies) > 0)
+            self.series_button.set_sensitive(len(provider.series) > 0)
+
+    @idle_function
+    def refresh_landing_page(self):
+        # Called while a playlist is being loaded, only update the counters
+        if self.stack.get_visible_child_name() == "landing_page":
+            self.update_landing_page()
+
     def open_keyboard_shortcuts(self, widget):
         gladefile = "/usr/share/hypnotix/shortcuts.ui"
         builder = Gtk.Builder()
@@ -848,15 +1311,18 @@ class MainWindow:
         if self.page_is_loading:
             return
         name = self.active_channel.name
-        data = f"{self.active_channel.info}:::{self.active_channel.url}"
-        if widget.get_active() and data not in self.favorite_data:
+        data = self.get_favorite(self.active_channel)
+        if widget.get_active() and data is None:
             print (f"Adding {name} to favorites")
-            self.favorite_data.append(data)
-        elif widget.get_active() == False and data in self.favorite_data:
+            self.favorite_data.add(f"{self.active_channel.info}:::{self.active_channel.url}")
+        elif widget.get_active() == False and data is not None:
             print (f"Removing {name} from favorites")
             self.favorite_data.remove(data)
         self.favorite_button_image.set_from_icon_name("xsi-starred-symbolic" if widget.get_active() else "non-xsi-starred-symbolic", Gtk.IconSize.BUTTON)
-        self.manager.save_favorites(self.favorite_data)
+
+    def get_favorite(self, channel):
+        # Channels don't keep their raw #EXTINF line, so favorites are matched by URL
+        return self.favorite_data.get(channel.url)
 
     def on_channel_activated(self, box, widget):
         self.active_channel = widget.channel
@@ -908,8 +1374,7 @@ class MainWindow:
         self.label_channel_url.set_text(channel.url)
 
         self.page_is_loading = True
-        data = f"{channel.info}:::{channel.url}"
-        if data in self.favorite_data:
+        if self.get_favorite(channel) is not None:
             self.favorite_button.set_active(True)
             self.favorite_button_image.set_from_icon_name("xsi-starred-symbolic", Gtk.IconSize.BUTTON)
             self.favorite_button.set_tooltip_text(_("Remove from favorites"))
@@ -1056,7 +1521,10 @@ class MainWindow:
     def refresh_providers_page(self):
         for child in self.providers_flowbox.get_children():
             self.providers_flowbox.remove(child)
-        for provider in self.providers:
+        self.widget_scheduler.run("providers", self.build_provider_boxes(list(self.providers)))
+
+    def build_provider_boxes(self, providers):
+        for provider in providers:
             labels_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
             image = Gtk.Image()
             image.set_from_icon_name("xsi-tv-symbolic", Gtk.IconSize.BUTTON)
@@ -1122,8 +1590,8 @@ class MainWindow:
             box.pack_start(button, False, False, 0)
 
             self.providers_flowbox.add(box)
-
-        self.providers_flowbox.show_all()
+            box.show_all()
+            yield
 
     def on_provider_selected(self, widget, provider):
         self.active_provider = provider
@@ -1168,9 +1636,8 @@ class MainWindow:
 
     @async_function
     def on_clear_icon_cache_button_clicked(self, widget, provider: Provider):
-        for channel in provider.channels:
-            if channel.logo_path:
-                Path(channel.logo_path).unlink(missing_ok=True)
+        # Logos which are shared with other providers are kept
+        self.manager.logo_cache.release(provider.name)
 
     def on_delete_button_clicked(self, widget, provider):
         self.navigate_to("delete_page", provider.name)
@@ -1211,6 +1678,7 @@ class MainWindow:
 
     def on_delete_yes_button(self, widget):
         self.providers.remove(self.marked_provider)
+        self.manager.logo_cache.release(self.marked_provider.name)
         if self.active_provider == self.marked_provider:
             self.active_provider = None
         self.marked_provider = None
@@ -1311,8 +1779,7 @@ class MainWindow:
         data = f'#EXTINF:-1 tvg-name="{name}" tvg-logo="{logo}" tvg-id="{name}" group-title="",{name}:::{url}'
         if data not in self.favorite_data:
             print (f"Adding {name} to favorites")
-            self.favorite_data.append(data)
-        self.manager.save_favorites(self.favorite_data)
+            self.favorite_data.add(data)
         self.show_favorites()
 
     def on_new_cancel_button(self, widget):
@@ -1505,10 +1972,40 @@ class MainWindow:
         #     # Same as click
         # #    pass
 
+    def load_provider_channels(self, provider, is_active, response=None):
+        """Parse the playlist of a provider, from its cache or while downloading it"""
+        self.status(_("Loading channels..."), provider)
+        # Make the active provider browsable while its playlist is being parsed,
+        # unless a previous version of it is already shown
+        show_batches = is_active and (self.active_provider is None or self.active_provider.name != provider.name)
+        if show_batches:
+            self.active_provider = provider
+        download = None
+        try:
+            if response is not None:
+                download = PlaylistDownload(provider, response)
+            for channels, groups, series in self.manager.load_channels_in_batches(provider, download=download):
+                if show_batches:
+                    self.refresh_landing_page()
+                    if len(groups) > 0:
+                        self.add_category_groups(provider, groups)
+        except Exception as e:
+            print("%s: %s" % (provider.name, e))
+            if download is not None:
+                # Keep what was received, unless it isn't a valid playlist
+                download.abort(resumable=not isinstance(e, ValueError))
+            elif response is not None:
+                response.close()
+            provider.groups, provider.channels, provider.movies, provider.series = [], [], [], []
+            return False
+        self.manager.save_catalog(provider)
+        return True
+
     @async_function
     def reload(self, page=None, refresh=False):
         self.favorite_data = self.manager.load_favorites()
         self.status(_("Loading providers..."))
+        previous_providers = {provider.get_info(): provider for provider in self.providers}
         self.providers = []
         for provider_info in self.settings.get_strv("providers"):
             try:
@@ -1517,75 +2014,39 @@ class MainWindow:
                 # Add provider to list. This must be done so that it shows up in the
                 # list of providers for editing.
                 self.providers.append(provider)
-
-                if provider.type_id != "xtream":
-                    # Download M3U
-                    if refresh:
-                        self.status(_("Downloading playlist..."), provider)
-                    else:
-                        self.status(_("Getting playlist..."), provider)
-                    ret = self.manager.get_playlist(provider, refresh=refresh)
-                    if ret:
-                        self.status(_("Checking playlist..."), provider)
-                        if self.manager.check_playlist(provider):
-                            self.status(_("Loading channels..."), provider)
-                            self.manager.load_channels(provider)
-                            if provider.name == self.settings.get_string("active-provider"):
-                                self.active_provider = provider
-                            self.status(None)
-                            print("%s: %d channels, %d groups, %d series, %d movies" % (provider.name, \
-                                len(provider.channels), len(provider.groups), len(provider.series), len(provider.movies)))
-                    else:
-                        self.status(_("Failed to download playlist from %s") %  provider.name, provider)
-
-                else:
-                    # Load xtream class
-                    from xtream import XTream
-
-                    # Download via Xtream
-                    self.x = XTream(
-                        provider.name,
-                        provider.username,
-                        provider.password,
-                        provider.url,
-                        hide_adult_content=False,
-                        user_agent=self.settings.get_string("user-agent"),
-                        cache_path=PROVIDERS_PATH,
-                    )
-                    if self.x.auth_data != {}:
-                        print("XTREAM `{}` Loading Channels".format(provider.name))
-                        # Save default cursor
-                        current_cursor = self.window.get_window().get_cursor()
-                        # Set waiting cursor
-                        self.window.get_window().set_cursor(Gdk.Cursor.new_from_name(Gdk.Display.get_default(), "wait"))
-                        # Load data
-                        self.x.load_iptv()
-                        # Restore default cursor
-                        self.window.get_window().set_cursor(current_cursor)
-                        # Inform Provider of data
-                        provider.channels = self.x.channels
-                        provider.movies = self.x.movies
-                        provider.series = self.x.series
-                        provider.groups = self.x.groups
-
-                        # Change redownload timeout
-                        self.reload_timeout_sec = 60 * 60 * 2  # 2 hours
-                        if self._timerid:
-                            GLib.source_remove(self._timerid)
-                        self._timerid = GLib.timeout_add_seconds(self.reload_timeout_sec, self.force_reload)
-
-                        # If no errors, approve provider
-                        if provider.name == self.settings.get_string("active-provider"):
-                            self.active_provider = provider
-                        self.status(None)
-                    else:
-                        print("XTREAM Authentication Failed")
-
             except Exception as e:
                 print(e)
                 traceback.print_exc()
                 print("Couldn't parse provider info: ", provider_info)
 
+        has_xtream = any(provider.type_id == "xtream" for provider in self.providers)
+        if has_xtream:
+            # Save default cursor
+            current_cursor = self.window.get_window().get_cursor()
+            # Set waiting cursor
+            self.window.get_window().set_cursor(Gdk.Cursor.new_from_name(Gdk.Display.get_default(), "wait"))
+
+        # Load the providers in parallel, the active one first so it becomes browsable as soon as possible
+        active_name = self.settings.get_string("active-provider")
+        indexes = sorted(range(len(self.providers)), key=lambda index: self.providers[index].name != active_name)
+        # The providers are loaded at the same time, so the memory they take is only measured as a whole
+        memory = get_resident_memory()
+        with ThreadPoolExecutor(max_workers=PROVIDER_LOAD_WORKERS) as executor:
+            futures = [executor.submit(self.load_provider, index, previous_providers, refresh) for index in indexes]
+        print("Providers loaded, resident memory %.1f MB -> %.1f MB" % (memory / 1048576, get_resident_memory() / 1048576))
+        loaded_xtream = any(future.result() and self.providers[index].type_id == "xtream" \
+            for index, future in zip(indexes, futures))
+
+        if has_xtream:
+            # Restore default cursor
+            self.window.get_window().set_cursor(current_cursor)
+        if loaded_xtream:
+            # Change redownload timeout
+            self.reload_timeout_sec = 60 * 60 * 2  # 2 hours
+            if self._timerid:
+                GLib.source_remove(self._timerid)
+            self._timerid = GLib.timeout_add_seconds(self.reload_timeout_sec, self.force_reload)
+
         # If there are more than 1 providers and no Active Provider, set to the first one
         if len(self.providers) > 0 and self.active_provider is None:
             self.active_provider = self.providers[0]
@@ -1597,6 +2058,130 @@ class MainWindow:
         self.status(None)
         self.latest_search_bar_text = None
 
+    def merge_catalog(self, current, provider):
+        """Patch the catalog of a provider on the main loop, which reads it, see Manager.merge_catalog()
+
+        Called from a worker thread, waits for the merge to be done.
+        """
+        done = threading.Event()
+        merged = []
+
+        def merge():
+            try:
+                # Catalogs kept in a ChannelStore aren't patched, see ChannelRows
+                views = [(view, list(view.items)) for view in (self.channels_view, self.vod_view) \
+                    if isinstance(view.items, list)]
+                merged.append(self.manager.merge_catalog(current, provider))
+                for view, items in views:
+                    # The views read the lists which were patched, rebuild them if they changed
+                    if view.items != items:
+                        view.set_items(view.items)
+            finally:
+                done.set()
+            return False
+
+        GLib.idle_add(merge)
+        done.wait()
+        return len(merged) > 0 and merged[0]
+
+    def load_provider(self, index, previous_providers, refresh):
+        """Load the channels of a provider, in a worker thread of reload()
+
+        Args:
+            index              (int):  Position of the provider in self.providers
+            previous_providers (dict): Providers loaded before the reload, by provider info
+            refresh            (bool): Whether to download the playlist again
+
+        Returns:
+            bool: True if the channels of the provider were loaded
+        """
+        provider = self.providers[index]
+        start_time = time.monotonic()
+        loaded = False
+        try:
+            if provider.type_id != "xtream":
+                # Download M3U
+                if refresh:
+                    self.status(_("Downloading playlist..."), provider)
+                else:
+                    self.status(_("Getting playlist..."), provider)
+                ret, response = self.manager.request_playlist(provider, refresh=refresh)
+                if ret:
+                    is_active = provider.name == self.settings.get_string("active-provider")
+                    previous = previous_providers.get(provider.get_info())
+                    loaded = False
+                    if response is not None:
+                        # Parse the playlist while it is being downloaded
+                        loaded = self.load_provider_channels(provider, is_active, response)
+                    elif not provider.modified and previous is not None and \
+                        len(previous.groups) + len(previous.channels) + len(previous.movies) + len(previous.series) > 0:
+                        # The playlist didn't change, keep the channels which are already loaded
+                        provider = previous
+                        self.providers[index] = provider
+                        loaded = True
+                    if not loaded:
+                        # Use the parsed catalog snapshot if the playlist didn't change
+                        loaded = self.manager.load_catalog(provider)
+                    if not loaded:
+                        self.status(_("Checking playlist..."), provider)
+                        if self.manager.check_playlist(provider):
+                            loaded = self.load_provider_channels(provider, is_active)
+                    if loaded and previous is not None and previous is not provider:
+                        # Patch the catalog which is already loaded, so that the objects
+                        # used by the UI survive the refresh
+                        if self.merge_catalog(previous, provider):
+                            provider = previous
+                            self.providers[index] = provider
+                    if loaded:
+                        if is_active:
+                            self.active_provider = provider
+                            self.refresh_landing_page()
+                        self.status(None)
+                        print("%s: %d channels, %d groups, %d series, %d movies" % (provider.name, \
+                            len(provider.channels), len(provider.groups), len(provider.series), len(provider.movies)))
+                else:
+                    self.status(_("Failed to download playlist from %s") %  provider.name, provider)
+
+            else:
+                # Load xtream class
+                from xtream import XTream
+
+                # Download via Xtream
+                x = XTream(
+                    provider.name,
+                    provider.username,
+                    provider.password,
+                    provider.url,
+                    hide_adult_content=False,
+                    user_agent=self.settings.get_string("user-agent"),
+                    cache_path=PROVIDERS_PATH,
+                )
+                if x.auth_data != {}:
+                    print("XTREAM `{}` Loading Channels".format(provider.name))
+                    # Load data
+                    x.load_iptv()
+                    # Inform Provider of data
+                    provider.channels = x.channels
+                    provider.movies = x.movies
+                    provider.series = x.series
+                    provider.groups = x.groups
+                    self.xtreams[provider.name] = x
+                    loaded = True
+
+                    # If no errors, approve provider
+                    if provider.name == self.settings.get_string("active-provider"):
+                        self.active_provider = provider
+                    self.status(None)
+                else:
+                    print("XTREAM Authentication Failed")
+
+        except Exception as e:
+            print(e)
+            traceback.print_exc()
+            print("Couldn't load provider: ", provider.name)
+        print("%s: loaded in %.1fs" % (provider.name, time.monotonic() - start_time))
+        return loaded
+
     def force_reload(self):
         self.reload(page=None, refresh=True)
         return False
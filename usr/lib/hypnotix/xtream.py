@@ -35,7 +35,6 @@ class Channel:
     id = ""
     name = ""  # What is the difference between the below name and title?
     logo = ""
-    logo_path = ""
     group_title = ""
     title = ""
     url = ""
@@ -71,7 +70,6 @@ class Channel:
             self.id = stream_info["stream_id"]
             self.name = stream_name
             self.logo = stream_info["stream_icon"]
-            self.logo_path = xtream._get_logo_local_path(self.logo)
             self.group_title = group_title
             self.title = stream_name
 
@@ -116,7 +114,6 @@ class Channel:
 
         jsondata["url"] = self.url
         jsondata.update(self.raw)
-        jsondata["logo_path"] = self.logo_path
 
         return jsondata
 
@@ -182,7 +179,6 @@ class Episode:
         self.av_info = episode_info["info"]
 
         self.logo = series_info["cover"]
-        self.logo_path = xtream._get_logo_local_path(self.logo)
 
         self.url = "{}/series/{}/{}/{}.{}".format(
             xtream.server,
@@ -201,7 +197,6 @@ class Serie:
     # Required by Hypnotix
     name = ""
     logo = ""
-    logo_path = ""
 
     # XTream
     series_id = ""
@@ -219,7 +214,6 @@ class Serie:
         # Required by Hypnotix
         self.name = series_info["name"]
         self.logo = series_info["cover"]
-        self.logo_path = xtream._get_logo_local_path(self.logo)
 
         self.seasons = {}
         self.episodes = {}
@@ -321,6 +315,23 @@ class XTream:
         self.hide_adult_content = hide_adult_content
         self.user_agent = user_agent
 
+        # Per-instance state, so that several providers can be loaded side by side
+        self.auth_data = {}
+        self.authorization = {}
+        self.groups = []
+        self.channels = []
+        self.series = []
+        self.movies = []
+        self.state = {"authenticated": False, "loaded": False}
+        self.catch_all_group = Group(
+            {
+                "category_id": "9999",
+                "category_name":"xEverythingElse",
+                "parent_id":0
+            },
+            ""
+        )
+
         # if the cache_path is specified, test that it is a directory
         if self.cache_path != "":
             # If the cache_path is not a directory, clear it
@@ -404,27 +415,6 @@ class XTream:
 
         return re.match(regex, url) is not None
 
-    def _get_logo_local_path(self, logo_url: str) -> str:
-        """Convert the Logo URL to a local Logo Path
-
-        Args:
-            logoURL (str): The Logo URL
-
-        Returns:
-            [type]: The logo path as a string or None
-        """
-        local_logo_path = None
-        if logo_url is not None:
-            if not self._validate_url(logo_url):
-                logo_url = None
-            else:
-                local_logo_path = osp.join(self.cache_path, "{}-{}".format(
-                    self._slugify(self.name),
-                    self._slugify(osp.split(logo_url)[-1])
-                )
-                )
-        return local_logo_path
-
     def authenticate(self):
         """Login to provider"""
         # If we have not yet successfully authenticated, attempt authentication